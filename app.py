@@ -1,14 +1,35 @@
+import base64
+import json
+import os
+from itertools import islice
+from urllib.parse import urlencode
+
 import sentry_sdk
 from decouple import config
-from flask import Flask, jsonify, url_for
+from flask import Flask, Response, g, jsonify, request, url_for
 from flask_caching import Cache
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_restplus import Api, Resource
 from sentry_sdk.integrations.flask import FlaskIntegration
+from werkzeug.wsgi import wrap_file
 
 import src.utils as util
-from src.errors import CountryNotFound, RegionNotFound
+from src.analytics import METRICS, MAX_DAYS, as_dict, parse_days, parse_metrics, rolling_metrics
+from src.bodies import ENCODINGS, body_fpath
+from src.derive import (SERIES_ENTRIES, UNSUPPORTED, DateAxis, combined_entry, region_entry, total_entry,
+                        total_series)
+from src.errors import CountryNotFound, GroupNotFound, InvalidParameter, RegionNotFound
+from src.formats import ENCODERS, MIMETYPES, Frame
+from src.manifest import MANIFEST_FNAME, read_manifest
+from src.population import rollup_population
+from src.rank import MAX_N, Ranking, parse_top, record_fields
+from src.rollup import GeoTree, Rollup
+from src.snapshots import CURRENT_DIR
+from src.engine import SQLiteEngine
+from src.series import TimeSeries
+from src.store import DatasetStore
+from src.stream import chunked, json_array, json_object, named, ndjson_lines
 
 sentry_sdk.init(
     dsn="https://38a1330e31e3462f94ece0a6eddb7368@sentry.stantabcorp.net/6",
@@ -18,6 +39,42 @@ sentry_sdk.init(
 
 API_VERSION = "v1"
 BASE_PATH = config("BASE_PATH")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 100
+# Output formats, by `format` query parameter. The compact ones (columnar
+# JSON, CSV and MessagePack) share one date axis for every row.
+FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    **MIMETYPES
+}
+STREAM_FORMATS = ("json", "ndjson")
+# Formats of the endpoints answering with a single entry
+ENTRY_FORMATS = ("json", *MIMETYPES)
+WINDOW_PARAMS = {
+    "from": "First date, mm/dd/yy or yyyy-mm-dd",
+    "to": "Last date (included), mm/dd/yy or yyyy-mm-dd",
+    "last": "Only the last N days up to `to`"
+}
+PAGE_PARAMS = {
+    "cursor": "Page to return, from the `Link` header of the previous page",
+    "limit": f"Number of countries per page, {DEFAULT_PAGE_SIZE} by default, {MAX_PAGE_SIZE} at most"
+}
+ANALYTICS_PARAMS = {
+    "metrics": f"Comma separated `{'` | `'.join(METRICS)}`, all of them by default",
+    "days": f"Rolling window of the mean, sum and doubling time, 7 by default, {MAX_DAYS} at most"
+}
+FORMAT_PARAMS = {
+    "format": f"`json` | `ndjson` (one country or region per line) | `{'` | `'.join(MIMETYPES)}`, "
+              "also negotiated from the Accept header"
+}
+ENTRY_FORMAT_PARAMS = {
+    "format": f"`json` | `{'` | `'.join(MIMETYPES)}`, also negotiated from the Accept header"
+}
+# "memory" serves the history and region endpoints from the mapped snapshot,
+# "sqlite" from the database built at ingest without loading those documents
+QUERY_ENGINE = config("QUERY_ENGINE", default="memory")
 ROUTES = [
     f"{BASE_PATH}/doc/",
     f"{BASE_PATH}/api/{API_VERSION}/all/",
@@ -30,12 +87,24 @@ ROUTES = [
     f"{BASE_PATH}/api/{API_VERSION}/proportion/<data_type>",
     f"{BASE_PATH}/api/{API_VERSION}/proportion/<data_type>/total",
     f"{BASE_PATH}/api/{API_VERSION}/proportion/<data_type>/<country>",
+    f"{BASE_PATH}/api/{API_VERSION}/proportion/<data_type>/<country>/regions",
+    f"{BASE_PATH}/api/{API_VERSION}/proportion/<data_type>/<country>/<region_name>",
     f"{BASE_PATH}/api/{API_VERSION}/daily/<data_type>",
     f"{BASE_PATH}/api/{API_VERSION}/daily/<data_type>/total",
     f"{BASE_PATH}/api/{API_VERSION}/daily/<data_type>/<country>",
     f"{BASE_PATH}/api/{API_VERSION}/proportion-daily/<data_type>",
     f"{BASE_PATH}/api/{API_VERSION}/proportion-daily/<data_type>/total",
     f"{BASE_PATH}/api/{API_VERSION}/proportion-daily/<data_type>/<country>",
+    f"{BASE_PATH}/api/{API_VERSION}/proportion-daily/<data_type>/<country>/regions",
+    f"{BASE_PATH}/api/{API_VERSION}/proportion-daily/<data_type>/<country>/<region_name>",
+    f"{BASE_PATH}/api/{API_VERSION}/analytics/<data_type>/total",
+    f"{BASE_PATH}/api/{API_VERSION}/analytics/<data_type>/<country>",
+    f"{BASE_PATH}/api/{API_VERSION}/analytics/<data_type>/<country>/<region_name>",
+    f"{BASE_PATH}/api/{API_VERSION}/country/<country>",
+    f"{BASE_PATH}/api/{API_VERSION}/group/<data_type>/<group>",
+    f"{BASE_PATH}/api/{API_VERSION}/rank/<metric>",
+    f"{BASE_PATH}/api/{API_VERSION}/batch/<kind>",
+    f"{BASE_PATH}/api/{API_VERSION}/status",
 ]
 SOURCES = [
     "https://github.com/CSSEGISandData/COVID-19",
@@ -67,11 +136,18 @@ limiter = Limiter(
     default_limits=["3/second", "60/minute", "2000/hour"],
     default_limits_exempt_when=util.no_limit_owner
 )
+# Shared by every worker of the node: a file-backed store by default
+# (served from the page cache), or a Redis-compatible server with
+# CACHE_TYPE=RedisCache and CACHE_REDIS_URL.
 cache = Cache(
     app,
     config={
-        "CACHE_TYPE": "simple",
-        "CACHE_DEFAULT_TIMEOUT": 15 * 60  # 15 minutes caching
+        "CACHE_TYPE": config("CACHE_TYPE", default="FileSystemCache"),
+        "CACHE_DIR": config("CACHE_DIR", default="/tmp/covid19-api-cache"),
+        "CACHE_REDIS_URL": config("CACHE_REDIS_URL", default="redis://localhost:6379/0"),
+        "CACHE_THRESHOLD": config("CACHE_THRESHOLD", default=5000, cast=int),
+        # Entries are keyed by data generation, the timeout only reclaims past generations
+        "CACHE_DEFAULT_TIMEOUT": 24 * 60 * 60
     }
 )
 
@@ -84,360 +160,802 @@ class SSLApiDoc(Api):
         return url_for(self.endpoint('specs'), _external=True, _scheme=scheme)
 
 
+engine = SQLiteEngine(CURRENT_DIR) if QUERY_ENGINE == "sqlite" else None
+# The derived documents are only read at ingest to pre-serialize the bodies,
+# the API renders their entries from the history series
+store = DatasetStore(CURRENT_DIR,
+                     [f for f in util.DATASET_FILES
+                      if f not in util.DERIVED_FILES and (engine is None or not f.endswith("_region.json"))],
+                     MANIFEST_FNAME,
+                     iso_fpath=util.ISO_FPATH, aliases=util.SPECIAL_CASES,
+                     blobs=util.DATASET_BODIES,
+                     columnar=util.DATASET_COLUMNAR)
 api = SSLApiDoc(app, doc='/doc/', version='1.0', title='COVID19 API',
                 description="Coronavirus COVID 19 API")
 
 
-@cache.memoize()
-def all_data():
+def generation_key(fname):
+    """Ties memoized results to the content of the dataset they were computed from.
+
+    Keyed by the content digest rather than the generation number, which
+    restarts in every data directory while the cache may outlive it.
+    """
+    return f"{fname}/{store.digest}"
+
+
+def find_series(fpath, country, message="This region cannot be found. Please try again."):
+    """Returns the time series of a history document and the key `country` resolves to in it"""
+    snapshot = store.snapshot()
+    series = snapshot.timeseries(fpath)
+    key = snapshot.resolver(fpath).resolve(country)
+    if key is None:
+        raise CountryNotFound(message)
+    return series, key
+
+
+def engine_country(fpath, country, message="This region cannot be found. Please try again."):
+    """Returns `(country_id, name, iso2, iso3)` of the entry `country` resolves to in the engine"""
+    if fpath not in util.DATASET_COLUMNAR:
+        raise FileNotFoundError(f"[Errno 2] No such file or directory: '{fpath}'")
+    found = engine.resolve(fpath, country)
+    if found is None:
+        raise CountryNotFound(message)
+    return found
+
+
+def region_fpath(data_type, country):
+    """Region document of `country`, the US states having their own"""
+    if country.lower() in ("us", "united states", "usa"):
+        return f"csv_{data_type}_us_region.json"
+    return f"csv_{data_type}_region.json"
+
+
+def region_series(data_type, country, region_name=None):
+    """Returns the time series holding the regions of `country` and its rows, only `region_name` if given.
+
+    The engine only stores the histories and populations, the series is
+    rebuilt from them in full so that derived values at the start of a window
+    are exact.
+    """
+    fpath = region_fpath(data_type, country)
+    if engine is not None:
+        try:
+            country_id, name, iso2, iso3 = engine_country(
+                fpath, country, "This country cannot be found. Please try again.")
+        except CountryNotFound:
+            if region_name is None:
+                raise
+            raise RegionNotFound("This region cannot be found. Please try again.")
+        if region_name is None:
+            regions = engine.regions_population(fpath, country_id)
+            histories = engine.iter_regions_history(data_type, fpath, country_id)
+        else:
+            region = engine.resolve_region(fpath, country_id, region_name)
+            if region is None:
+                raise RegionNotFound("This region cannot be found. Please try again.")
+            regions = [region[1:]]
+            histories = [(region[1], {"history": engine.history(data_type, country_id, region[0])})]
+        entries = {
+            region: {"history": entry["history"], "population": float("nan") if population is None else population}
+            for (region, entry), (_, population) in zip(histories, regions)
+        }
+        series = TimeSeries.from_regions({name: {"regions": entries, "iso2": iso2, "iso3": iso3}})
+        return series, slice(0, len(series.keys))
+    snapshot = store.snapshot()
+    series = snapshot.timeseries(fpath)
+    resolver = snapshot.resolver(fpath)
+    inner_country = resolver.resolve(country)
+    if region_name is None:
+        if inner_country is None:
+            raise CountryNotFound("This country cannot be found. Please try again.")
+        return series, series.groups[inner_country]
+    region = resolver.resolve_region(inner_country, region_name)
+    if region is None:
+        raise RegionNotFound("This region cannot be found. Please try again.")
+    row = series.rows[inner_country, region]
+    return series, slice(row, row + 1)
+
+
+def send_body(name):
+    """Sends a body pre-serialized at ingest, honouring Accept-Encoding and If-None-Match.
+
+    Streamed from its file in the snapshot (with sendfile where the server
+    supports it), so the bodies stay in the page cache shared by the workers.
+    """
+    snapshot = store.snapshot()
+    encoding = next(
+        (e for e in ENCODINGS if request.accept_encodings[e] and body_fpath(name, e) in snapshot.blobs),
+        None)
+    etag = f"{name}-{snapshot.digest}" + (f"-{encoding}" if encoding else "")
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, mimetype="application/json", headers=headers)
+    else:
+        f = open(snapshot.blob(body_fpath(name, encoding)), "rb")
+        headers["Content-Length"] = os.fstat(f.fileno()).st_size
+        response = Response(wrap_file(request.environ, f), mimetype="application/json", headers=headers,
+                            direct_passthrough=True)
+    response.set_etag(etag)
+    return response
+
+
+def window_args():
+    """`from`, `to` and `last` query parameters, passed on to the views so they are part of the memoize key"""
+    return request.args.get("from"), request.args.get("to"), request.args.get("last")
+
+
+def list_arg(name):
+    """Values of a query parameter given repeated and/or comma separated, in order and without duplicates"""
+    values = (value.strip() for arg in request.args.getlist(name) for value in arg.split(","))
+    return tuple(dict.fromkeys(value for value in values if value))
+
+
+def page_args():
+    """`cursor` and `limit` query parameters of the collections"""
+    return request.args.get("cursor"), request.args.get("limit")
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def page_rows(keys, cursor=None, limit=None):
+    """Returns the rows of the page starting at `cursor` and the cursor of the next page, None after the last one"""
+    start = 0
+    if cursor is not None:
+        try:
+            start = keys.index(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))))
+        except ValueError:
+            raise InvalidParameter("Invalid cursor, the collection may have changed since")
+    try:
+        limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidParameter(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    stop = min(start + limit, len(keys))
+    return slice(start, stop), encode_cursor(keys[stop]) if stop < len(keys) else None
+
+
+def format_arg(allowed=FORMATS):
+    """Format asked with the `format` query parameter, or else the best match of the Accept header among `allowed`.
+
+    Not validated, so it can be passed on to the memoized views which check it.
+    """
+    # The response depends on the request headers, see `vary_on_format`
+    g.negotiated = True
+    fmt = request.args.get("format")
+    if fmt is None:
+        mimetype = request.accept_mimetypes.best_match([FORMATS[name] for name in allowed], default=FORMATS["json"])
+        return next(name for name in allowed if FORMATS[name] == mimetype)
+    return fmt
+
+
+def check_format(fmt, allowed=FORMATS):
+    if fmt not in allowed:
+        raise InvalidParameter(f"Unknown format {fmt!r}, expected one of {', '.join(allowed)}")
+    return fmt
+
+
+def response_format(allowed=FORMATS):
+    return check_format(format_arg(allowed), allowed)
+
+
+def send_stream(parts, fmt, next_cursor=None):
+    """Streams a response from the text `parts`, linking to the next page of a collection if any"""
+    response = Response(chunked(parts), mimetype=FORMATS[fmt])
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args["cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def send_frame(frame, fmt, next_cursor=None, buffered=False):
+    """Encodes `frame` in one of the compact formats, `buffered` for the memoized views that cannot return a stream"""
+    parts = ENCODERS[fmt](frame)
+    if buffered:
+        body = list(parts)
+        return Response(body[0][:0].join(body), mimetype=FORMATS[fmt])
+    return send_stream(parts, fmt, next_cursor)
+
+
+def stream_pairs(pairs, fmt, next_cursor=None):
+    """Streams `(key, entry)` pairs as one JSON object, or as one NDJSON line per entry"""
+    parts = ndjson_lines(named(pairs)) if fmt == "ndjson" else json_object(pairs)
+    return send_stream(parts, fmt, next_cursor)
+
+
+def collection_pairs(kind, data_type, start=None, stop=None, last=None, cursor=None, limit=None):
+    """Returns the `(country, entry)` pairs of a collection window or page, rendered lazily, and the next cursor"""
+    series = store.timeseries(f"csv_{data_type}.json")
+    window = series.window(start, stop, last)
+    rows, next_cursor = slice(None), None
+    if cursor is not None or limit is not None:
+        rows, next_cursor = page_rows(series.keys, cursor, limit)
+    population = series.population_vector(util.get_populations())
+    entry = SERIES_ENTRIES[kind]
+    pairs = (
+        (series.keys[i], entry(series, i, population[i], window))
+        for i in range(len(series.keys))[rows]
+    )
+    return pairs, next_cursor
+
+
+def build_rollups(series):
+    """Rollups of the counts and populations of the countries of a history series, custom groups included"""
+    tree = GeoTree([(key,) for key in series.keys])
+    groups = {}
+    for name, members in util.get_groups().items():
+        members = set(members)
+        groups[name] = [(key,) for key, iso3 in zip(series.keys, series.iso3) if iso3 in members]
+    population = rollup_population(tree, series.population_vector(util.get_populations()), groups)
+    return Rollup(tree, series.values, groups), population
+
+
+def rollups(data_type):
+    """Returns the history series of `data_type` and the rollups of its counts and populations"""
+    snapshot = store.snapshot()
+    series = snapshot.timeseries(f"csv_{data_type}.json")
+    counts, population = snapshot.cached(("rollup", data_type), lambda: build_rollups(series))
+    return series, counts, population
+
+
+def world_series(data_type):
+    """One row series of the world totals of `data_type`"""
+    series, counts, _ = rollups(data_type)
+    return total_series(series, total=counts.node())
+
+
+@cache.memoize(make_name=generation_key)
+def world_total(data_type, start=None, stop=None, last=None):
+    world = world_series(data_type)
+    return total_entry(world, util.WORLD_POPULATION, world.window(start, stop, last))
+
+
+def country_entry(kind, data_type, country, start=None, stop=None, last=None):
+    """Entry of `country` in a derived collection, rendered from its mapped history series"""
+    series, region = find_series(f"csv_{data_type}.json", country)
+    row = series.rows[region]
+    population = series.population_vector(util.get_populations())[row]
+    window = None if start is None and stop is None and last is None else series.window(start, stop, last)
+    ret = dict(SERIES_ENTRIES[kind](series, row, population, window))
+    ret["name"] = region
+    return ret
+
+
+def collection_frame(kind, data_type, start=None, stop=None, last=None, cursor=None, limit=None):
+    """Same rows as `collection_pairs`, as one matrix for the compact formats"""
+    series = store.timeseries(f"csv_{data_type}.json")
+    window = series.window(start, stop, last)
+    rows, next_cursor = slice(None), None
+    if cursor is not None or limit is not None:
+        rows, next_cursor = page_rows(series.keys, cursor, limit)
+    population = series.population_vector(util.get_populations())
+    return Frame.from_series(series, kind, rows, population, window), next_cursor
+
+
+def country_frame(kind, data_type, country, start=None, stop=None, last=None):
+    """Entry of `country` in a derived collection as a one row frame"""
+    series, region = find_series(f"csv_{data_type}.json", country)
+    row = series.rows[region]
+    population = series.population_vector(util.get_populations())
+    return Frame.from_series(series, kind, [row], population, series.window(start, stop, last))
+
+
+def collection(kind, data_type, body, start=None, stop=None, last=None, cursor=None, limit=None):
+    fmt = response_format()
+    if fmt == "json" and all(arg is None for arg in (start, stop, last, cursor, limit)):
+        return send_body(body)
+    if fmt in MIMETYPES:
+        frame, next_cursor = collection_frame(kind, data_type, start, stop, last, cursor, limit)
+        return send_frame(frame, fmt, next_cursor)
+    pairs, next_cursor = collection_pairs(kind, data_type, start, stop, last, cursor, limit)
+    return stream_pairs(pairs, fmt, next_cursor)
+
+
+def world_total_body(key, data_type, body, start=None, stop=None, last=None):
+    fmt = response_format(ENTRY_FORMATS)
+    if fmt in MIMETYPES:
+        world = world_series(data_type)
+        frame = Frame.from_series(world, key.replace("-", "_"), [0], [util.WORLD_POPULATION],
+                                  world.window(start, stop, last), columns={})
+        return send_frame(frame, fmt)
+    if start is None and stop is None and last is None:
+        return send_body(body)
+    return jsonify({key: world_total(data_type, start, stop, last)[key]})
+
+
+def all_data(cursor=None, limit=None):
     try:
-        data = util.read_json("data.json")
-        return jsonify(data)
+        fmt = response_format(STREAM_FORMATS)
+        if fmt == "json" and cursor is None and limit is None:
+            return send_body("all")
+        data = store.get("data.json")
+        rows, next_cursor = slice(0, len(data)), None
+        if cursor is not None or limit is not None:
+            rows, next_cursor = page_rows([entry["country"] for entry in data], cursor, limit)
+        entries = islice(data, rows.start, rows.stop)
+        return send_stream(ndjson_lines(entries) if fmt == "ndjson" else json_array(entries), fmt, next_cursor)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
+@cache.memoize(make_name=generation_key)
 def all_country(country):
     try:
-        data = util.read_json("data.json")
-        for region in data:
-            if util.pattern_match(
-                    country,
-                    region["country"],
-                    region["iso2"],
-                    region["iso3"]):
-                return jsonify(region)
-        raise CountryNotFound("This region cannot be found. Please try again.")
+        snapshot = store.snapshot()
+        data = snapshot.get("data.json")
+        index = snapshot.resolver("data.json").resolve(country)
+        if index is None:
+            raise CountryNotFound("This region cannot be found. Please try again.")
+        return jsonify(data[index])
     except CountryNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def history(data_type):
+def history(data_type, start=None, stop=None, last=None, cursor=None, limit=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        return jsonify(data)
+        return collection("history", data_type, f"history_{data_type}", start, stop, last, cursor, limit)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def history_country(data_type, country):
+@cache.memoize(make_name=generation_key)
+def history_country(data_type, country, start=None, stop=None, last=None, fmt="json"):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        for region in list(data.keys()):
-            if util.pattern_match(
-                    country,
-                    region,
-                    data[region]["iso2"],
-                    data[region]["iso3"]):
-                ret = data[region]
-                ret["name"] = region
-                return jsonify(ret)
-        raise CountryNotFound("This region cannot be found. Please try again.")
+        compact = check_format(fmt, ENTRY_FORMATS) in MIMETYPES
+        if engine is not None:
+            country_id, region, iso2, iso3 = engine_country(f"csv_{data_type}.json", country)
+            entry = {
+                "history": engine.history(data_type, country_id, 0, start, stop, last),
+                "iso2": iso2,
+                "iso3": iso3,
+                "name": region
+            }
+            if compact:
+                frame = Frame.from_pairs("history", [(region, entry)], {"iso2": [iso2], "iso3": [iso3]})
+                return send_frame(frame, fmt, buffered=True)
+            return jsonify(entry)
+        series, region = find_series(f"csv_{data_type}.json", country)
+        row = series.rows[region]
+        window = series.window(start, stop, last)
+        if compact:
+            return send_frame(Frame.from_series(series, "history", [row], window=window), fmt, buffered=True)
+        return jsonify({
+            "history": series.as_dict(series.values[row, window], window),
+            "iso2": series.iso2[row],
+            "iso3": series.iso3[row],
+            "name": region
+        })
     except CountryNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def history_region(data_type, country, region_name):
+@cache.memoize(make_name=generation_key)
+def history_region(data_type, country, region_name, start=None, stop=None, last=None, fmt="json"):
     try:
-        if country.lower() in ("us", "united states", "usa"):
-            data = util.read_json(f"csv_{data_type}_us_region.json")
-        else:
-            data = util.read_json(f"csv_{data_type}_region.json")
-        for inner_country in list(data.keys()):
-            if util.pattern_match(
-                    country,
-                    inner_country,
-                    data[inner_country]["iso2"],
-                    data[inner_country]["iso3"]):
-                for region in data[inner_country]["regions"]:
-                    if region.lower() == region_name.lower():
-                        return jsonify(data[inner_country]["regions"][region])
-        raise RegionNotFound("This region cannot be found. Please try again.")
+        compact = check_format(fmt, ENTRY_FORMATS) in MIMETYPES
+        fpath = region_fpath(data_type, country)
+        if engine is not None:
+            try:
+                country_id = engine_country(fpath, country)[0]
+            except CountryNotFound:
+                raise RegionNotFound("This region cannot be found. Please try again.")
+            region = engine.resolve_region(fpath, country_id, region_name)
+            if region is None:
+                raise RegionNotFound("This region cannot be found. Please try again.")
+            history = engine.history(data_type, country_id, region[0], start, stop, last)
+            if compact:
+                return send_frame(Frame.from_pairs("history", [(region[1], {"history": history})]), fmt,
+                                  buffered=True)
+            return jsonify({"history": history})
+        snapshot = store.snapshot()
+        series = snapshot.timeseries(fpath)
+        resolver = snapshot.resolver(fpath)
+        inner_country = resolver.resolve(country)
+        region = resolver.resolve_region(inner_country, region_name)
+        if region is None:
+            raise RegionNotFound("This region cannot be found. Please try again.")
+        window = series.window(start, stop, last)
+        row = series.rows[inner_country, region]
+        if compact:
+            frame = Frame.from_series(series, "history", [row], window=window, names=[region], columns={})
+            return send_frame(frame, fmt, buffered=True)
+        return jsonify({"history": series.as_dict(series.values[row, window], window)})
     except RegionNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def history_region_all(data_type, country):
+def history_region_all(data_type, country, start=None, stop=None, last=None):
     try:
-        if country.lower() in ("us", "united states", "usa"):
-            data = util.read_json(f"csv_{data_type}_us_region.json")
-        else:
-            data = util.read_json(f"csv_{data_type}_region.json")
-        for inner_country in list(data.keys()):
-            if util.pattern_match(
-                    country,
-                    inner_country,
-                    data[inner_country]["iso2"],
-                    data[inner_country]["iso3"]):
-                return jsonify(data[inner_country]["regions"])
-        raise CountryNotFound(
-            "This country cannot be found. Please try again.")
+        fpath = region_fpath(data_type, country)
+        fmt = response_format()
+        if engine is not None:
+            country_id = engine_country(fpath, country, "This country cannot be found. Please try again.")[0]
+            pairs = engine.iter_regions_history(data_type, fpath, country_id, start, stop, last)
+            if fmt in MIMETYPES:
+                return send_frame(Frame.from_pairs("history", pairs), fmt)
+            return stream_pairs(pairs, fmt)
+        series, inner_country = find_series(
+            fpath, country, "This country cannot be found. Please try again.")
+        rows = series.groups[inner_country]
+        window = series.window(start, stop, last)
+        if fmt in MIMETYPES:
+            names = [series.keys[i][1] for i in range(rows.start, rows.stop)]
+            return send_frame(Frame.from_series(series, "history", rows, window=window, names=names, columns={}), fmt)
+        pairs = (
+            (series.keys[i][1], {"history": series.as_dict(series.values[i, window], window)})
+            for i in range(rows.start, rows.stop)
+        )
+        return stream_pairs(pairs, fmt)
     except CountryNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def history_region_world(data_type):
+def history_region_world(data_type, start=None, stop=None, last=None):
     try:
-
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"history": {}}
-        for d in data.keys():
-            for h in data[d]["history"].keys():
-                if h not in ret["history"]:
-                    ret["history"][h] = int(data[d]["history"][h])
-                else:
-                    ret["history"][h] += int(data[d]["history"][h])
-        return jsonify(ret)
+        return world_total_body("history", data_type, f"history_total_{data_type}", start, stop, last)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def proportion(data_type):
+def proportion(data_type, start=None, stop=None, last=None, cursor=None, limit=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        for region in list(data.keys()):
-            ret = {"proportion": {}}
-            if data[region]["iso3"] == "":
-                # TODO: Note, some regions do not have iso2/3 codes....
-                data[region] = {
-                    "proportion": "This region doesn't work with this function atm"}
-                continue
-            if data[region]["iso3"] in util.populations:
-                pop = float(util.populations[data[region]["iso3"]])
-            else:
-                util.populations = util.csv_to_dict(util.CSV_POPULATIONS)
-                pop = float(util.populations[data[region]["iso3"]])
-
-            for d, h in data[region]["history"].items():
-                ret["proportion"][d] = f"{round(h / pop * 100, 5):.5f}"
-
-            ret["iso2"] = data[region]["iso2"]
-            ret["iso3"] = data[region]["iso3"]
-            data[region] = ret
-        return jsonify(data)
+        return collection("proportion", data_type, f"proportion_{data_type}", start, stop, last, cursor, limit)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def proportion_country(data_type, country):
+@cache.memoize(make_name=generation_key)
+def proportion_country(data_type, country, start=None, stop=None, last=None, fmt="json"):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"proportion": {}}
-        for region in list(data.keys()):
-            if util.pattern_match(
-                    country,
-                    region,
-                    data[region]["iso2"],
-                    data[region]["iso3"]):
-                if data[region]["iso3"] in util.populations:
-                    pop = float(util.populations[data[region]["iso3"]])
-                else:
-                    util.populations = util.csv_to_dict(util.CSV_POPULATIONS)
-                    pop = float(util.populations[data[region]["iso3"]])
-
-                for d, h in data[region]["history"].items():
-                    ret["proportion"][d] = f"{round(h / pop * 100, 5):.5f}"
-
-                ret["iso2"] = data[region]["iso2"]
-                ret["iso3"] = data[region]["iso3"]
-                ret["name"] = region
-                return jsonify(ret)
-        raise CountryNotFound("This region cannot be found. Please try again.")
+        if check_format(fmt, ENTRY_FORMATS) in MIMETYPES:
+            return send_frame(country_frame("proportion", data_type, country, start, stop, last), fmt, buffered=True)
+        return jsonify(country_entry("proportion", data_type, country, start, stop, last))
     except CountryNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def proportion_region_world(data_type):
+def proportion_region_world(data_type, start=None, stop=None, last=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"proportion": {}}
-        for d in data.keys():
-            for h in data[d]["history"].keys():
-                if h not in ret["proportion"]:
-                    ret["proportion"][h] = int(data[d]["history"][h])
-                else:
-                    ret["proportion"][h] += int(data[d]["history"][h])
-        for h in ret["proportion"]:
-            ret["proportion"][h] = f"{round(int(ret['proportion'][h]) / int(util.WORLD_POPULATION) * 100, 5):.5f}"
-        return jsonify(ret)
+        return world_total_body("proportion", data_type, f"proportion_total_{data_type}", start, stop, last)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def daily(data_type):
+def daily(data_type, start=None, stop=None, last=None, cursor=None, limit=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        for region in list(data.keys()):
-            ret = {"daily": {}}
-
-            prev = 0
-            for d, h in data[region]["history"].items():
-                ret["daily"][d] = h - prev
-                prev = int(h)
-
-            ret["iso2"] = data[region]["iso2"]
-            ret["iso3"] = data[region]["iso3"]
-            data[region] = ret
-        return jsonify(data)
+        return collection("daily", data_type, f"daily_{data_type}", start, stop, last, cursor, limit)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def daily_region_world(data_type):
+def daily_region_world(data_type, start=None, stop=None, last=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"daily": {}}
-        for d in data.keys():
-            for h in data[d]["history"].keys():
-                if h not in ret["daily"]:
-                    ret["daily"][h] = int(data[d]["history"][h])
-                else:
-                    ret["daily"][h] += int(data[d]["history"][h])
-        prev = 0
-        for d, h in ret["daily"].items():
-            ret["daily"][d] = h - prev
-            prev = int(h)
-        return jsonify(ret)
+        return world_total_body("daily", data_type, f"daily_total_{data_type}", start, stop, last)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+@cache.memoize(make_name=generation_key)
+def daily_country(data_type, country, start=None, stop=None, last=None, fmt="json"):
+    try:
+        if check_format(fmt, ENTRY_FORMATS) in MIMETYPES:
+            return send_frame(country_frame("daily", data_type, country, start, stop, last), fmt, buffered=True)
+        return jsonify(country_entry("daily", data_type, country, start, stop, last))
+    except CountryNotFound as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+def proportion_daily(data_type, start=None, stop=None, last=None, cursor=None, limit=None):
+    try:
+        return collection("proportion_daily", data_type, f"proportion_daily_{data_type}",
+                          start, stop, last, cursor, limit)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+def proportion_daily_region_world(data_type, start=None, stop=None, last=None):
+    try:
+        return world_total_body("proportion-daily", data_type, f"proportion_daily_total_{data_type}",
+                                start, stop, last)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def daily_country(data_type, country):
+@cache.memoize(make_name=generation_key)
+def proportion_daily_country(data_type, country, start=None, stop=None, last=None, fmt="json"):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"daily": {}}
-        for region in list(data.keys()):
-            if util.pattern_match(
-                    country,
-                    region,
-                    data[region]["iso2"],
-                    data[region]["iso3"]):
-                prev = 0
-                for d, h in data[region]["history"].items():
-                    ret["daily"][d] = h - prev
-                    prev = h
-                ret["iso2"] = data[region]["iso2"]
-                ret["iso3"] = data[region]["iso3"]
-                ret["name"] = region
-                return jsonify(ret)
-        raise CountryNotFound("This region cannot be found. Please try again.")
+        if check_format(fmt, ENTRY_FORMATS) in MIMETYPES:
+            frame = country_frame("proportion_daily", data_type, country, start, stop, last)
+            return send_frame(frame, fmt, buffered=True)
+        return jsonify(country_entry("proportion_daily", data_type, country, start, stop, last))
     except CountryNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+@cache.memoize(make_name=generation_key)
+def region_proportion(kind, data_type, country, region_name, start=None, stop=None, last=None, fmt="json"):
+    try:
+        compact = check_format(fmt, ENTRY_FORMATS) in MIMETYPES
+        series, rows = region_series(data_type, country, region_name)
+        window = series.window(start, stop, last)
+        if compact:
+            frame = Frame.from_series(series, kind, rows, series.population, window,
+                                      names=[series.keys[rows.start][1]], columns={})
+            return send_frame(frame, fmt, buffered=True)
+        return jsonify(region_entry(series, kind, rows.start, window))
+    except RegionNotFound as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def proportion_daily(data_type):
+def region_proportion_all(kind, data_type, country, start=None, stop=None, last=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        for region in list(data.keys()):
-            ret = {"proportion-daily": {}}
-
-            if data[region]["iso3"] == "":
-                # TODO: Note, some regions do not have iso2/3 codes....
-                data[region] = {
-                    "proportion-daily": "This region doesn't work with this function atm"}
-                continue
-            if data[region]["iso3"] in util.populations:
-                pop = float(util.populations[data[region]["iso3"]])
-            else:
-                util.populations = util.csv_to_dict(util.CSV_POPULATIONS)
-                pop = float(util.populations[data[region]["iso3"]])
-
-            prev = 0
-            for d, h in data[region]["history"].items():
-                ret["proportion-daily"][d] = f"{round((h - prev) / pop * 100, 10):.10f}"
-                prev = int(h)
-
-            ret["iso2"] = data[region]["iso2"]
-            ret["iso3"] = data[region]["iso3"]
-            data[region] = ret
-        return jsonify(data)
+        fmt = response_format()
+        series, rows = region_series(data_type, country)
+        window = series.window(start, stop, last)
+        names = [series.keys[i][1] for i in range(rows.start, rows.stop)]
+        if fmt in MIMETYPES:
+            frame = Frame.from_series(series, kind, rows, series.population, window, names=names, columns={})
+            return send_frame(frame, fmt)
+        pairs = (
+            (series.keys[i][1], region_entry(series, kind, i, window))
+            for i in range(rows.start, rows.stop)
+        )
+        return stream_pairs(pairs, fmt)
+    except CountryNotFound as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def proportion_daily_region_world(data_type):
+def analytics_entry(series, row, population, metrics, days, start=None, stop=None, last=None):
+    """Rolling metrics of one row, computed over its whole series so the first windows of `start` are full"""
+    metrics = parse_metrics(metrics)
+    days = parse_days(days)
+    window = series.window(start, stop, last)
+    dates = series.dates[window]
+    computed = rolling_metrics(series.values[row:row + 1], [population], days, metrics)
+    return {"days": days, **{metric: as_dict(dates, values[0, window]) for metric, values in computed.items()}}
+
+
+@cache.memoize(make_name=generation_key)
+def analytics_country(data_type, country, metrics=(), days=None, start=None, stop=None, last=None):
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"proportion-daily": {}}
-        for d in data.keys():
-            for h in data[d]["history"].keys():
-                if h not in ret["proportion-daily"]:
-                    ret["proportion-daily"][h] = int(data[d]["history"][h])
-                else:
-                    ret["proportion-daily"][h] += int(data[d]["history"][h])
-        prev = 0
-        for d, h in ret["proportion-daily"].items():
-            ret["proportion-daily"][d] = f"{round((h - prev) / int(util.WORLD_POPULATION) * 100, 10):.10f}"
-            prev = int(h)
+        series, region = find_series(f"csv_{data_type}.json", country)
+        row = series.rows[region]
+        population = series.population_vector(util.get_populations())[row]
+        ret = analytics_entry(series, row, population, metrics, days, start, stop, last)
+        ret.update(iso2=series.iso2[row], iso3=series.iso3[row], name=region)
         return jsonify(ret)
+    except CountryNotFound as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+@cache.memoize(make_name=generation_key)
+def analytics_region(data_type, country, region_name, metrics=(), days=None, start=None, stop=None, last=None):
+    try:
+        series, rows = region_series(data_type, country, region_name)
+        return jsonify(analytics_entry(series, rows.start, series.population[rows.start], metrics, days,
+                                       start, stop, last))
+    except RegionNotFound as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+@cache.memoize(make_name=generation_key)
+def analytics_world(data_type, metrics=(), days=None, start=None, stop=None, last=None):
+    try:
+        world = world_series(data_type)
+        return jsonify(analytics_entry(world, 0, util.WORLD_POPULATION, metrics, days, start, stop, last))
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
-@cache.memoize()
-def proportion_daily_country(data_type, country):
+@cache.memoize(make_name=generation_key)
+def country_combined(country, kinds=(), start=None, stop=None, last=None):
+    """Every data type of a country, and the `kinds` of series asked for, on one date axis"""
     try:
-        data = util.read_json(f"csv_{data_type}.json")
-        ret = {"proportion-daily": {}}
-        for region in list(data.keys()):
-            if util.pattern_match(
-                    country,
-                    region,
-                    data[region]["iso2"],
-                    data[region]["iso3"]):
-
-                if data[region]["iso3"] in util.populations:
-                    pop = float(util.populations[data[region]["iso3"]])
-                else:
-                    util.populations = util.csv_to_dict(util.CSV_POPULATIONS)
-                    pop = float(util.populations[data[region]["iso3"]])
-
-                prev = 0
-                for d, h in data[region]["history"].items():
-                    ret["proportion-daily"][d] = f"{round((h - prev) / pop * 100, 10):.10f}"
-                    prev = h
-                ret["iso2"] = data[region]["iso2"]
-                ret["iso3"] = data[region]["iso3"]
-                ret["name"] = region
-                return jsonify(ret)
-        raise CountryNotFound("This region cannot be found. Please try again.")
+        kinds = tuple(kind.replace("-", "_") for kind in kinds) or ("history",)
+        for kind in kinds:
+            if kind not in SERIES_ENTRIES:
+                raise InvalidParameter(f"Unknown kind {kind!r}, expected one of "
+                                       f"{', '.join(SERIES_ENTRIES).replace('_', '-')}")
+        snapshot = store.snapshot()
+        key = snapshot.resolver(f"csv_{util.DATA_TYPES[0]}.json").resolve(country)
+        if key is None:
+            raise CountryNotFound("This region cannot be found. Please try again.")
+        series = {data_type: snapshot.timeseries(f"csv_{data_type}.json") for data_type in util.DATA_TYPES}
+        axis = snapshot.cached("date_axis", lambda: DateAxis(series))
+        first = series[util.DATA_TYPES[0]]
+        row = first.rows[key]
+        return jsonify({
+            "name": key,
+            "iso2": first.iso2[row],
+            "iso3": first.iso3[row],
+            **combined_entry(axis, series, util.get_populations(), key, kinds, axis.window(start, stop, last))
+        })
     except CountryNotFound as e:
         return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+def find_group(counts, group):
+    """Name of the custom group `group` designates, case insensitive"""
+    for name in counts.members:
+        if name.lower() == group.lower():
+            return name
+    raise GroupNotFound(f"Unknown group {group!r}, expected one of {', '.join(counts.members)}")
+
+
+@cache.memoize(make_name=generation_key)
+def group_total(data_type, group, start=None, stop=None, last=None):
+    """Totals of a custom group of countries like the world totals, rated by the population of its members"""
+    try:
+        series, counts, population = rollups(data_type)
+        name = find_group(counts, group)
+        total = total_series(series, name, counts.group(name))
+        ret = {"name": name, "members": [key for key, in counts.members[name]]}
+        ret.update(total_entry(total, population.group(name), total.window(start, stop, last)))
+        if not population.group(name) > 0:
+            ret["proportion"] = ret["proportion-daily"] = UNSUPPORTED
+        return jsonify(ret)
+    except GroupNotFound as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=404)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+def build_ranking(snapshot, metric):
+    """Ranking of a data.json field, or of the latest values of a series for `<kind>-<data_type>`"""
+    for data_type in util.DATA_TYPES:
+        kind = metric[:-len(data_type) - 1].replace("-", "_")
+        if metric.endswith(f"-{data_type}") and kind in SERIES_ENTRIES:
+            series = snapshot.timeseries(f"csv_{data_type}.json")
+            return Ranking.from_series(series, kind, series.population_vector(util.get_populations()))
+    records = snapshot.get("data.json")
+    fields = snapshot.cached("rank_fields", lambda: record_fields(records))
+    if metric not in fields:
+        raise InvalidParameter(f"Unknown metric {metric!r}, expected one of {', '.join(fields)} "
+                               f"or <kind>-<data_type> like history-confirmed or proportion-daily-deaths")
+    return Ranking.from_records(records, metric)
+
+
+def rank(metric, n=None, order=None):
+    try:
+        n, order = parse_top(n, order)
+        snapshot = store.snapshot()
+        ranking = snapshot.cached(("rank", metric), lambda: build_ranking(snapshot, metric))
+        ret = {"metric": metric, "order": order}
+        if ranking.date is not None:
+            ret["date"] = ranking.date
+        ret["ranking"] = ranking.top(n, order)
+        return jsonify(ret)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
+    except Exception as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+@cache.memoize(make_name=generation_key)
+def batch(kind, countries, data_types, start=None, stop=None, last=None):
+    """Entries of several countries and data types resolved in one pass over each dataset.
+
+    A country that cannot be found is reported in place of its entry, like
+    the status and message its own endpoint would answer with.
+    """
+    try:
+        kind = kind.replace("-", "_")
+        if kind not in SERIES_ENTRIES:
+            raise InvalidParameter(f"Unknown kind {kind!r}, expected one of {', '.join(SERIES_ENTRIES).replace('_', '-')}")
+        if not countries:
+            raise InvalidParameter("countries is required")
+        if len(countries) > MAX_BATCH_SIZE:
+            raise InvalidParameter(f"At most {MAX_BATCH_SIZE} countries per batch")
+        for data_type in data_types:
+            if data_type not in util.DATA_TYPES:
+                raise InvalidParameter(f"Unknown data type {data_type!r}")
+        snapshot = store.snapshot()
+        populations = util.get_populations()
+        ret = {}
+        for data_type in data_types or util.DATA_TYPES:
+            fpath = f"csv_{data_type}.json"
+            series = snapshot.timeseries(fpath)
+            resolver = snapshot.resolver(fpath)
+            window = series.window(start, stop, last)
+            population = series.population_vector(populations)
+            ret[data_type] = {}
+            for country in countries:
+                key = resolver.resolve(country)
+                if key is None:
+                    ret[data_type][country] = {
+                        "status": 404,
+                        "error": "CountryNotFound : This region cannot be found. Please try again."
+                    }
+                    continue
+                row = series.rows[key]
+                entry = dict(SERIES_ENTRIES[kind](series, row, population[row], window))
+                entry["name"] = key
+                ret[data_type][country] = entry
+        return jsonify(ret)
+    except InvalidParameter as e:
+        return util.response_error(message=f"{type(e).__name__} : {e}", status=400)
     except Exception as e:
         return util.response_error(message=f"{type(e).__name__} : {e}")
 
 
 @api.route(f"/api/{API_VERSION}/all/")
 class All(Resource):
-    @api.doc(responses=responses)
+    @api.doc(responses=responses, params={**PAGE_PARAMS, **FORMAT_PARAMS})
     def get(self):
-        return all_data()
+        return all_data(*page_args())
 
 
 @api.route(f"/api/{API_VERSION}/all/<country>/")
@@ -449,122 +967,289 @@ class AllSelector(Resource):
 
 @api.route(f"/api/{API_VERSION}/history/<data_type>/")
 class HistoryDataType(Resource):
-    @api.doc(
-        responses=responses)
+    @api.doc(responses=responses, params={**WINDOW_PARAMS, **PAGE_PARAMS, **FORMAT_PARAMS})
     def get(self, data_type: int):
-        return history(data_type)
+        return history(data_type, *window_args(), *page_args())
 
 
 @api.route(f"/api/{API_VERSION}/history/<data_type>/<country>/")
 class HistoryDataTypeCountry(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
                      "country": "Full name or ISO-3166-1"})
     def get(self, data_type: str, country: str):
-        return history_country(data_type, country)
+        return history_country(data_type, country, *window_args(), format_arg(ENTRY_FORMATS))
 
 
 @api.route(f"/api/{API_VERSION}/history/<data_type>/<country>/<region>")
 class HistoryDataTypeRegion(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
                      "country": "Full name or ISO-3166-1", "region": "Region name"})
     def get(self, data_type: str, country: str, region: str):
-        return history_region(data_type, country, region)
+        return history_region(data_type, country, region, *window_args(), format_arg(ENTRY_FORMATS))
 
 
 @api.route(f"/api/{API_VERSION}/history/<data_type>/<country>/regions")
 class HistoryDataTypeRegions(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+             params={**WINDOW_PARAMS, **FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
                      "country": "Full name or ISO-3166-1"})
     def get(self, data_type: str, country: str):
-        return history_region_all(data_type, country)
+        return history_region_all(data_type, country, *window_args())
 
 
 @api.route(f"/api/{API_VERSION}/history/<data_type>/total")
 class HistoryDataTypeTotal(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
     def get(self, data_type: str):
-        return history_region_world(data_type)
+        return history_region_world(data_type, *window_args())
 
 
 @api.route(f"/api/{API_VERSION}/proportion/<data_type>/")
 class ProportionDataType(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
+             params={**WINDOW_PARAMS, **PAGE_PARAMS, **FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
     def get(self, data_type: str):
-        return proportion(data_type)
+        return proportion(data_type, *window_args(), *page_args())
 
 
 @api.route(f"/api/{API_VERSION}/proportion/<data_type>/total")
 class ProportionDataTypeTotal(Resource):
     @api.doc(responses=responses,
-             params={
-                 "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"},
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"},
              description="Returns the percentage of the world's population to be affected by COVID-19")
     def get(self, data_type: str):
-        return proportion_region_world(data_type)
+        return proportion_region_world(data_type, *window_args())
 
 
 @api.route(f"/api/{API_VERSION}/proportion/<data_type>/<country>/")
 class ProportionDataTypeCountry(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
                      "country": "Full name or ISO-3166-1"})
     def get(self, data_type: str, country: str):
-        return proportion_country(data_type, country)
+        return proportion_country(data_type, country, *window_args(), format_arg(ENTRY_FORMATS))
+
+
+@api.route(f"/api/{API_VERSION}/proportion/<data_type>/<country>/regions")
+class ProportionDataTypeRegions(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "country": "Full name or ISO-3166-1"},
+             description="Returns the percentage of the population of each region to be affected by COVID-19")
+    def get(self, data_type: str, country: str):
+        return region_proportion_all("proportion", data_type, country, *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/proportion/<data_type>/<country>/<region>")
+class ProportionDataTypeRegion(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "country": "Full name or ISO-3166-1", "region": "Region name"})
+    def get(self, data_type: str, country: str, region: str):
+        return region_proportion("proportion", data_type, country, region, *window_args(), format_arg(ENTRY_FORMATS))
 
 
 @api.route(f"/api/{API_VERSION}/daily/<data_type>/")
 class DailyDataType(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
+             params={**WINDOW_PARAMS, **PAGE_PARAMS, **FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
     def get(self, data_type: str):
-        return daily(data_type)
+        return daily(data_type, *window_args(), *page_args())
 
 
 @api.route(f"/api/{API_VERSION}/daily/<data_type>/total")
 class DailyDataTypeTotal(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
     def get(self, data_type: str):
-        return daily_region_world(data_type)
+        return daily_region_world(data_type, *window_args())
 
 
 @api.route(f"/api/{API_VERSION}/daily/<data_type>/<country>/")
 class DailyDataTypeCountry(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
                      "country": "Full name or ISO-3166-1"})
     def get(self, data_type: str, country: str):
-        return daily_country(data_type, country)
+        return daily_country(data_type, country, *window_args(), format_arg(ENTRY_FORMATS))
 
 
 @api.route(f"/api/{API_VERSION}/proportion-daily/<data_type>/")
 class ProportionDailyDataType(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
+             params={**WINDOW_PARAMS, **PAGE_PARAMS, **FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
     def get(self, data_type: str):
-        return proportion_daily(data_type)
+        return proportion_daily(data_type, *window_args(), *page_args())
 
 
 @api.route(f"/api/{API_VERSION}/proportion-daily/<data_type>/total")
 class ProportionDailyDataTypeTotal(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"})
     def get(self, data_type: str):
-        return proportion_daily_region_world(data_type)
+        return proportion_daily_region_world(data_type, *window_args())
 
 
 @api.route(f"/api/{API_VERSION}/proportion-daily/<data_type>/<country>")
 class ProportionDailyDataTypeCountry(Resource):
     @api.doc(responses=responses,
-             params={"data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
                      "country": "Full name or ISO-3166-1"})
     def get(self, data_type: str, country: str):
-        return proportion_daily_country(data_type, country)
+        return proportion_daily_country(data_type, country, *window_args(), format_arg(ENTRY_FORMATS))
+
+
+@api.route(f"/api/{API_VERSION}/proportion-daily/<data_type>/<country>/regions")
+class ProportionDailyDataTypeRegions(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "country": "Full name or ISO-3166-1"})
+    def get(self, data_type: str, country: str):
+        return region_proportion_all("proportion_daily", data_type, country, *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/proportion-daily/<data_type>/<country>/<region>")
+class ProportionDailyDataTypeRegion(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **ENTRY_FORMAT_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "country": "Full name or ISO-3166-1", "region": "Region name"})
+    def get(self, data_type: str, country: str, region: str):
+        return region_proportion("proportion_daily", data_type, country, region, *window_args(),
+                                 format_arg(ENTRY_FORMATS))
+
+
+@api.route(f"/api/{API_VERSION}/analytics/<data_type>/total")
+class AnalyticsDataTypeTotal(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **ANALYTICS_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`"},
+             description="Rolling mean and sum, 14 days incidence per 100k, doubling time and week over week "
+                         "change in percent of the world total")
+    def get(self, data_type: str):
+        return analytics_world(data_type, list_arg("metrics"), request.args.get("days"), *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/analytics/<data_type>/<country>/")
+class AnalyticsDataTypeCountry(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **ANALYTICS_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "country": "Full name or ISO-3166-1"},
+             description="Rolling mean and sum, 14 days incidence per 100k, doubling time and week over week "
+                         "change in percent of a country")
+    def get(self, data_type: str, country: str):
+        return analytics_country(data_type, country, list_arg("metrics"), request.args.get("days"), *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/analytics/<data_type>/<country>/<region>")
+class AnalyticsDataTypeRegion(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS, **ANALYTICS_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "country": "Full name or ISO-3166-1", "region": "Region name"},
+             description="Rolling mean and sum, 14 days incidence per 100k, doubling time and week over week "
+                         "change in percent of a region")
+    def get(self, data_type: str, country: str, region: str):
+        return analytics_region(data_type, country, region, list_arg("metrics"), request.args.get("days"),
+                                *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/country/<country>")
+class Country(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS,
+                     "country": "Full name or ISO-3166-1",
+                     "kinds": "Comma separated `history` | `daily` | `proportion` | `proportion-daily`, "
+                              "`history` by default"},
+             description="Confirmed, deaths and recovered series of a country in one response, "
+                         "as arrays on a shared `dates` axis")
+    def get(self, country: str):
+        return country_combined(country, list_arg("kinds"), *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/group/<data_type>/<group>")
+class Group(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS,
+                     "data_type": "Input accepted : `confirmed` | `recovered` | `deaths`",
+                     "group": "A continent (`Africa`, `Asia`, `Europe`, `North America`, `South America`, "
+                              "`Oceania`) or `EU`"},
+             description="History, daily and per-capita totals of a group of countries, and its members")
+    def get(self, data_type: str, group: str):
+        return group_total(data_type, group, *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/rank/<metric>")
+class Rank(Resource):
+    @api.doc(responses=responses,
+             params={"metric": "A numeric field of `/all`, like `totalCases`, or the latest value of a series: "
+                               "`history` | `daily` | `proportion` | `proportion-daily` followed by `-<data_type>`",
+                     "n": f"Number of countries, 10 by default, {MAX_N} at most",
+                     "order": "`desc` (default) | `asc`"},
+             description="Top countries by one metric, countries without a value are left out")
+    def get(self, metric: str):
+        return rank(metric, request.args.get("n"), request.args.get("order"))
+
+
+@api.route(f"/api/{API_VERSION}/batch/<kind>")
+class Batch(Resource):
+    @api.doc(responses=responses,
+             params={**WINDOW_PARAMS,
+                     "kind": "Input accepted : `history` | `daily` | `proportion` | `proportion-daily`",
+                     "countries": f"Full names or ISO-3166-1, comma separated, {MAX_BATCH_SIZE} at most",
+                     "data_types": "Comma separated `confirmed` | `recovered` | `deaths`, all of them by default"},
+             description="Several countries and data types in one response, "
+                         "a country that cannot be found is reported in place of its entry")
+    def get(self, kind: str):
+        return batch(kind, list_arg("countries"), list_arg("data_types"), *window_args())
+
+
+@api.route(f"/api/{API_VERSION}/status")
+class Status(Resource):
+    @api.doc(responses=responses,
+             description="Current data generation, the time of the last successful update and of the last data change")
+    def get(self):
+        try:
+            manifest = read_manifest(CURRENT_DIR)
+            served = store.generation
+            return jsonify({
+                "generation": manifest["generation"],
+                # A number like `generation`, a content hash for data published without a manifest
+                "servedGeneration": int(served) if served.isdigit() else served,
+                "lastUpdate": manifest["lastUpdate"],
+                "lastChange": manifest["lastChange"],
+                "datasets": manifest["datasets"]
+            })
+        except Exception as e:
+            return util.response_error(message=f"{type(e).__name__} : {e}")
+
+
+@app.after_request
+def vary_on_format(response):
+    """Tells shared caches that a response negotiated with `format_arg` differs by Accept and Accept-Encoding"""
+    if g.get("negotiated"):
+        response.vary.update(("Accept", "Accept-Encoding"))
+    return response
 
 
 @app.route("/")
@@ -0,0 +1,93 @@
+"""Compares the JHU time series parsers on a large synthetic CSV.
+
+    python -m benchmarks.bench_parser --rows 3500 --dates 1100 --us
+
+`legacy` is the DictReader / strptime loop `csv_to_json` used before the
+dedicated parser, `parser` is `src.parser.parse_time_series`.
+"""
+import argparse
+import csv
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from src.parser import parse_time_series
+
+US_HEADER = ["UID", "iso2", "iso3", "code3", "FIPS", "Admin2", "Province_State", "Country_Region",
+             "Lat", "Long_", "Combined_Key", "Population"]
+GLOBAL_HEADER = ["Province/State", "Country/Region", "Lat", "Long"]
+
+
+def write_csv(fpath, rows, dates, us):
+    first = datetime.date(2020, 1, 22)
+    header = (US_HEADER if us else GLOBAL_HEADER) + [
+        (first + datetime.timedelta(days=d)).strftime("%-m/%-d/%y") for d in range(dates)
+    ]
+    with open(fpath, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            # Seeded per row: a row is the same whatever the number of rows,
+            # and one more date only appends a cell to every row
+            rng = random.Random(i)
+            if us:
+                meta = [84000000 + i, "US", "USA", 840, f"{i}.0", f"County {i}", f"State {i % 58}", "US",
+                        "0.0", "0.0", f"County {i}, State {i % 58}, US", rng.randint(1000, 10 ** 6)]
+            else:
+                meta = [f"Province {i}" if i % 3 else "", f"Country {i // 3}", "0.0", "0.0"]
+            total, values = 0, []
+            for _ in range(dates):
+                total += rng.randint(0, 50)
+                values.append(total)
+            writer.writerow(meta + values)
+
+
+def legacy(csv_fpath, key_start):
+    """The per-cell parsing of the former `csv_to_json`, without the ISO lookup"""
+    csv_json = {}
+    with open(csv_fpath, "r") as csv_file:
+        data = csv.DictReader(csv_file)
+        for i, row in enumerate(data):
+            country = i  # one entry per row, like the counties of the US files
+            csv_json[country] = {"history": {}}
+            for key in list(row.keys())[key_start:]:
+                new_k = datetime.datetime.strptime(key, "%m/%d/%y").strftime("%m/%d/%y")
+                csv_json[country]["history"][new_k] = int(float(row[key]))
+            csv_json[country]["history"] = dict(sorted(
+                csv_json[country]["history"].items(),
+                key=lambda item: datetime.datetime.strptime(item[0], "%m/%d/%y")))
+    return csv_json
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3500)
+    parser.add_argument("--dates", type=int, default=1100)
+    parser.add_argument("--us", action="store_true", help="US layout, 12 metadata columns")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = os.path.join(tmp, "bench.csv")
+        write_csv(fpath, args.rows, args.dates, args.us)
+        size = os.path.getsize(fpath) / 2 ** 20
+        print(f"{args.rows} rows x {args.dates} dates ({size:.1f} MiB, {'US' if args.us else 'global'} layout)")
+        if not args.skip_legacy:
+            reference = timed("legacy", legacy, fpath, len(US_HEADER) if args.us else len(GLOBAL_HEADER))
+        elapsed = timed("parser", parse_time_series, fpath)
+        if not args.skip_legacy:
+            print(f"{'speedup':<12} {reference / elapsed:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
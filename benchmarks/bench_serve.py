@@ -0,0 +1,164 @@
+"""Load tests the API behind gunicorn/gevent, as deployed.
+
+    python -m benchmarks.bench_serve --root /app --duration 20 --connections 64
+
+The server is started from the directory `--root` holding the published
+snapshot (`current`) and serves a mix of endpoints over keep-alive
+connections spread across `--clients` processes.
+Requests are sent with the owner `Authorization` key, when the environment
+has one, so the rate limits do not skew the results. Prints requests/sec and
+latency percentiles of each server, compare `--workers` counts with several
+runs.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from decouple import config
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = [
+    "/api/v1/all/",
+    "/api/v1/all/france",
+    "/api/v1/history/confirmed/total",
+    "/api/v1/history/confirmed/france",
+    "/api/v1/daily/deaths/germany?last=30",
+    "/api/v1/proportion/confirmed/italy",
+    "/api/v1/history/confirmed/us/regions",
+    "/api/v1/history/deaths/?limit=50",
+    "/api/v1/analytics/confirmed/total?last=30",
+    "/api/v1/rank/totalCases",
+]
+SERVERS = {
+    "gunicorn": lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "--worker-class", "gevent", "--workers", str(workers),
+        "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+}
+
+
+def start(name, port, workers, root):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO, os.environ.get("PYTHONPATH")])))
+    process = subprocess.Popen(SERVERS[name](port, workers), cwd=root, env=env, start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/v1/status")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop(process)
+    raise RuntimeError(f"{name} did not answer within 60s")
+
+
+def stop(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def client(port, connections, deadline, paths, headers, results):
+    """One client process: `connections` threads each looping over `paths` on its own connection"""
+    latencies, errors = [], []
+
+    def loop(offset):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors.append(path)
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                errors.append(path)
+        conn.close()
+
+    threads = [threading.Thread(target=loop, args=(n,)) for n in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, len(errors)))
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else float("nan")
+
+
+def load(port, args, paths, headers):
+    """Runs one load test against `port`, returns `(requests, errors, sorted latencies)`"""
+    results = multiprocessing.Queue()
+    per_client = max(1, args.connections // args.clients)
+    # Warm up the memoized views and the snapshot of every worker
+    deadline = time.monotonic() + args.warmup
+    client(port, per_client, deadline, paths, headers, results)
+    results.get()
+    deadline = time.monotonic() + args.duration
+    processes = [
+        multiprocessing.Process(target=client, args=(port, per_client, deadline, paths, headers, results))
+        for _ in range(args.clients)
+    ]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        part, part_errors = results.get()
+        latencies += part
+        errors += part_errors
+    for process in processes:
+        process.join()
+    return len(latencies), errors, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=".", help="Directory holding the published snapshot")
+    parser.add_argument("--servers", default=",".join(SERVERS), help="Comma separated, in the order to test")
+    parser.add_argument("--workers", type=int, default=8, help="gunicorn workers")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=4, help="Client processes sharing the connections")
+    parser.add_argument("--path", action="append", help="Endpoint to request, repeatable, a fixed mix by default")
+    args = parser.parse_args()
+
+    paths = args.path or PATHS
+    authorization = config("Authorization", default=None)
+    headers = {"Authorization": authorization} if authorization else {}
+    print(f"{len(paths)} endpoints, {args.connections} connections, {args.duration:.0f}s per server")
+    print(f"{'server':<10} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name in args.servers.split(","):
+        process = start(name, args.port, args.workers, os.path.abspath(args.root))
+        try:
+            requests, errors, latencies = load(args.port, args, paths, headers)
+        finally:
+            stop(process)
+        print(f"{name:<10} {requests / args.duration:9.0f} {percentile(latencies, 50) * 1000:8.2f} "
+              f"{percentile(latencies, 99) * 1000:8.2f} {errors:7d}")
+
+
+if __name__ == "__main__":
+    main()
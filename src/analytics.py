@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+
+from src.errors import InvalidParameter
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 90
+# Incidence is reported over two weeks, week over week change compares weeks
+INCIDENCE_DAYS = 14
+WEEK = 7
+METRICS = ("rolling-mean", "rolling-sum", "incidence", "doubling-time", "week-over-week")
+DIGITS = 4
+
+
+def parse_days(days) -> int:
+    """Length of the rolling window, `DEFAULT_DAYS` when not given"""
+    if days is None:
+        return DEFAULT_DAYS
+    try:
+        days = int(days)
+    except ValueError:
+        days = 0
+    if not 1 <= days <= MAX_DAYS:
+        raise InvalidParameter(f"days must be between 1 and {MAX_DAYS}")
+    return days
+
+
+def parse_metrics(metrics) -> tuple:
+    """Requested metrics in the order of `METRICS`, all of them when none is given"""
+    for metric in metrics:
+        if metric not in METRICS:
+            raise InvalidParameter(f"Unknown metric {metric!r}, expected one of {', '.join(METRICS)}")
+    return tuple(metric for metric in METRICS if not metrics or metric in metrics)
+
+
+def window_sums(values, days: int) -> np.ndarray:
+    """Sum of the `days` columns ending at each column, as a difference of cumulative sums.
+
+    Columns before the first full window are NaN.
+    """
+    cumsum = np.cumsum(values, axis=-1)
+    ret = np.full(cumsum.shape, np.nan)
+    if days <= cumsum.shape[-1]:
+        ret[..., days - 1] = cumsum[..., days - 1]
+        ret[..., days:] = cumsum[..., days:] - cumsum[..., :-days]
+    return ret
+
+
+def doubling_time(cumulative, days: int) -> np.ndarray:
+    """Days the counts would take to double at the growth rate of the last `days` days, NaN without growth"""
+    ret = np.full(cumulative.shape, np.nan)
+    now = cumulative[..., days:].astype(np.float64)
+    before = cumulative[..., :-days].astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        doubling = days * np.log(2) / np.log(now / before)
+    doubling[~((before > 0) & (now > before))] = np.nan
+    ret[..., days:] = doubling
+    return ret
+
+
+def week_over_week(daily) -> np.ndarray:
+    """Change in percent of the last 7 days total over the 7 days before, NaN when those had none"""
+    weeks = window_sums(daily, WEEK)
+    ret = np.full(weeks.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (weeks[..., WEEK:] - weeks[..., :-WEEK]) / weeks[..., :-WEEK] * 100
+    change[~(weeks[..., :-WEEK] > 0)] = np.nan
+    ret[..., WEEK:] = change
+    return ret
+
+
+def rolling_metrics(values, population, days: int = DEFAULT_DAYS, metrics=METRICS) -> dict:
+    """Computes `metrics` for every row of the cumulative `values` matrix over all of its dates.
+
+    `population` is aligned with the rows (NaN when unknown, which makes the
+    incidence NaN as well).
+    """
+    daily = np.diff(values, axis=-1, prepend=0)
+    ret = {}
+    if "rolling-mean" in metrics or "rolling-sum" in metrics:
+        sums = window_sums(daily, days)
+        if "rolling-mean" in metrics:
+            ret["rolling-mean"] = sums / days
+        if "rolling-sum" in metrics:
+            ret["rolling-sum"] = sums
+    if "incidence" in metrics:
+        population = np.asarray(population, dtype=np.float64)
+        ret["incidence"] = window_sums(daily, INCIDENCE_DAYS) / population[:, None] * 100000
+    if "doubling-time" in metrics:
+        ret["doubling-time"] = doubling_time(values, days)
+    if "week-over-week" in metrics:
+        ret["week-over-week"] = week_over_week(daily)
+    return {metric: ret[metric] for metric in metrics}
+
+
+def as_dict(dates, row) -> dict:
+    """Maps `dates` to the rounded values of `row`, None where they are NaN or infinite"""
+    return {
+        date: round(value, DIGITS) if math.isfinite(value) else None
+        for date, value in zip(dates, row.tolist())
+    }
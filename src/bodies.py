@@ -0,0 +1,53 @@
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+BODIES_DIR = "bodies"
+ENCODINGS = ("br", "gzip")
+# Past these levels the bodies barely shrink while compressing them takes
+# many times longer, and every refresh recompresses all of them
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def collection_bodies(data_types):
+    """`(name, source document, key)` of every collection endpoint body written at ingest"""
+    bodies = [("all", "data.json", None)]
+    for data_type in data_types:
+        bodies += [
+            (f"history_{data_type}", f"csv_{data_type}.json", None),
+            (f"history_total_{data_type}", f"csv_{data_type}_total.json", "history"),
+            (f"daily_{data_type}", f"csv_{data_type}_daily.json", None),
+            (f"daily_total_{data_type}", f"csv_{data_type}_total.json", "daily"),
+            (f"proportion_{data_type}", f"csv_{data_type}_proportion.json", None),
+            (f"proportion_total_{data_type}", f"csv_{data_type}_total.json", "proportion"),
+            (f"proportion_daily_{data_type}", f"csv_{data_type}_proportion_daily.json", None),
+            (f"proportion_daily_total_{data_type}", f"csv_{data_type}_total.json", "proportion-daily"),
+        ]
+    return bodies
+
+
+def body_fpath(name: str, encoding: str = None) -> str:
+    fpath = f"{BODIES_DIR}/{name}.json"
+    if encoding == "gzip":
+        return fpath + ".gz"
+    if encoding == "br":
+        return fpath + ".br"
+    return fpath
+
+
+def serialize(data) -> bytes:
+    """Same bytes as `flask.jsonify` produces outside of debug mode"""
+    return (json.dumps(data, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def compress(body: bytes) -> dict:
+    # A fixed mtime keeps the output, and so the manifest digests, reproducible
+    encoded = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return encoded
@@ -0,0 +1,68 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from src.series import TimeSeries
+from src.snapshots import atomic_write
+
+MAGIC = b"C19C"
+VERSION = 1
+# magic, version, header length, matrix offset
+PREAMBLE = struct.Struct("<4sIQQ")
+ALIGNMENT = 64
+
+
+def columnar_fpath(json_fpath: str) -> str:
+    """csv_confirmed_region.json -> csv_confirmed_region.bin"""
+    return json_fpath[:-len(".json")] + ".bin"
+
+
+def pack(series: TimeSeries) -> bytes:
+    """Serializes `series`: preamble, string tables, then the contiguous little endian matrix.
+
+    The matrix is stored as int32 whenever the counts fit, and is aligned so
+    it can be mapped as is.
+    """
+    values = np.ascontiguousarray(series.values)
+    dtype = "<i4" if values.size == 0 or (values.min() >= -2 ** 31 and values.max() < 2 ** 31) else "<i8"
+    header = json.dumps({
+        "dtype": dtype,
+        "shape": [len(series.keys), len(series.dates)],
+        "dates": series.dates,
+        "keys": [list(key) if isinstance(key, tuple) else key for key in series.keys],
+        "iso2": series.iso2,
+        "iso3": series.iso3,
+        "groups": [[country, group.start, group.stop] for country, group in series.groups.items()],
+        "population": [None if np.isnan(value) else value for value in series.population.tolist()]
+    }, separators=(",", ":")).encode()
+    offset = PREAMBLE.size + len(header)
+    offset += -offset % ALIGNMENT
+    preamble = PREAMBLE.pack(MAGIC, VERSION, len(header), offset)
+    padding = b"\0" * (offset - PREAMBLE.size - len(header))
+    return preamble + header + padding + values.astype(dtype).tobytes()
+
+
+def write_columnar(fpath: str, series: TimeSeries):
+    atomic_write(fpath, pack(series), binary=True)
+
+
+def load_columnar(fpath: str) -> TimeSeries:
+    """Maps a file written by `write_columnar`, the matrix stays in the page cache shared by every worker"""
+    with open(fpath, "rb") as f:
+        magic, version, header_len, offset = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{fpath} is not a version {VERSION} columnar snapshot")
+        header = json.loads(f.read(header_len))
+    shape = tuple(header["shape"])
+    if os.path.getsize(fpath) != offset + np.dtype(header["dtype"]).itemsize * shape[0] * shape[1]:
+        raise ValueError(f"{fpath} is truncated")
+    if shape[0] * shape[1]:
+        values = np.memmap(fpath, dtype=header["dtype"], mode="r", offset=offset, shape=shape)
+    else:
+        values = np.zeros(shape, dtype=header["dtype"])
+    groups = {country: slice(start, stop) for country, start, stop in header["groups"]}
+    keys = [tuple(key) if isinstance(key, list) else key for key in header["keys"]]
+    population = [np.nan if value is None else value for value in header.get("population", [None] * shape[0])]
+    return TimeSeries(header["dates"], keys, values, header["iso2"], header["iso3"], groups, population)
@@ -0,0 +1,161 @@
+import numpy as np
+
+from src.series import TimeSeries, date_sort_key, date_window
+
+UNSUPPORTED = "This region doesn't work with this function atm"
+DERIVED_SUFFIXES = ("daily", "proportion", "proportion_daily", "total")
+
+
+def derived_fpath(json_fpath: str, suffix: str) -> str:
+    return json_fpath.replace(".json", f"_{suffix}.json")
+
+
+def history_entry(series: TimeSeries, i: int, window: slice = None) -> dict:
+    values = series.values[i] if window is None else series.values[i, window]
+    return {"history": series.as_dict(values, window), "iso2": series.iso2[i], "iso3": series.iso3[i]}
+
+
+def daily_entry(series: TimeSeries, i: int, window: slice = None) -> dict:
+    return {"daily": series.as_dict(series.daily(series.values[i], window), window),
+            "iso2": series.iso2[i], "iso3": series.iso3[i]}
+
+
+def proportion_entry(series: TimeSeries, i: int, population: float, window: slice = None) -> dict:
+    # Unknown (NaN) or zero
+    if not population > 0:
+        # TODO: Note, some regions do not have iso2/3 codes....
+        return {"proportion": UNSUPPORTED}
+    values = series.values[i] if window is None else series.values[i, window]
+    return {"proportion": series.as_formatted_dict(series.per_capita(values, population), 5, window),
+            "iso2": series.iso2[i], "iso3": series.iso3[i]}
+
+
+def proportion_daily_entry(series: TimeSeries, i: int, population: float, window: slice = None) -> dict:
+    if not population > 0:
+        return {"proportion-daily": UNSUPPORTED}
+    daily = series.daily(series.values[i], window)
+    return {"proportion-daily": series.as_formatted_dict(series.per_capita(daily, population), 10, window),
+            "iso2": series.iso2[i], "iso3": series.iso3[i]}
+
+
+def total_entry(series: TimeSeries, world_population: int, window: slice = None) -> dict:
+    """World totals of the `history`, `daily`, `proportion` and `proportion-daily` series"""
+    values = series.values if window is None else series.values[:, window]
+    total = values.sum(axis=0)
+    if window is None or window.start == 0:
+        total_daily = series.daily(total)
+    else:
+        total_daily = np.diff(series.values[:, window.start - 1:window.stop].sum(axis=0))
+    return {
+        "history": series.as_dict(total, window),
+        "daily": series.as_dict(total_daily, window),
+        "proportion": series.as_formatted_dict(series.per_capita(total, world_population), 5, window),
+        "proportion-daily": series.as_formatted_dict(series.per_capita(total_daily, world_population), 10, window)
+    }
+
+
+def total_series(series: TimeSeries, name: str = "World", total=None) -> TimeSeries:
+    """One row series of a total over the dates of `series`, the world total unless `total` is given.
+
+    What the compact formats and the analytics render the totals from.
+    """
+    total = series.total() if total is None else total
+    return TimeSeries(series.dates, [name], total[None, :], [""], [""])
+
+
+ENTRIES = {
+    "daily": lambda series, i, population, window: daily_entry(series, i, window),
+    "proportion": proportion_entry,
+    "proportion_daily": proportion_daily_entry
+}
+# Every entry a history series can be rendered as, by collection name
+SERIES_ENTRIES = {
+    "history": lambda series, i, population, window: history_entry(series, i, window),
+    **ENTRIES
+}
+
+
+def region_entry(series: TimeSeries, kind: str, i: int, window: slice = None) -> dict:
+    """Entry of the region in row `i` rated by its own population, only its series like the history of a region"""
+    key = kind.replace("_", "-")
+    return {key: SERIES_ENTRIES[kind](series, i, series.population[i], window)[key]}
+
+
+# Digits the proportions are rounded to, as in the JSON documents
+DIGITS = {"proportion": 5, "proportion_daily": 10}
+
+
+def series_matrix(series: TimeSeries, kind: str, rows, population, window: slice = None) -> np.ndarray:
+    """Vectorized counterpart of `SERIES_ENTRIES`: the `rows x window` matrix of one kind of series.
+
+    Proportions are rounded like their JSON rendering and are NaN for rows
+    without a known population.
+    """
+    if kind in ("daily", "proportion_daily"):
+        values = series.daily(series.values[rows], window)
+    else:
+        values = series.values[rows][:, window or slice(None)]
+    if kind in DIGITS:
+        values = np.round(series.per_capita(values, np.asarray(population)[rows]), DIGITS[kind])
+    return values
+
+
+def derive(data: dict, populations: dict, world_population: int) -> dict:
+    """Builds every series served by the daily/proportion endpoints from a history document.
+
+    Returns the documents by suffix, each one already in the shape of the
+    matching response so the API only has to look them up.
+    """
+    series = TimeSeries.from_history(data)
+    population = series.population_vector(populations)
+    ret = {
+        suffix: {region: entry(series, i, population[i], None) for i, region in enumerate(series.keys)}
+        for suffix, entry in ENTRIES.items()
+    }
+    ret["total"] = total_entry(series, world_population)
+    return ret
+
+
+class DateAxis:
+    """Union of the dates of several series and where the columns of each of them fall on it"""
+
+    def __init__(self, series: dict):
+        self.dates = sorted(set().union(*(s.dates for s in series.values())), key=date_sort_key)
+        self._date_keys = [date_sort_key(date) for date in self.dates]
+        columns = {date: j for j, date in enumerate(self.dates)}
+        self.positions = {
+            name: np.array([columns[date] for date in s.dates], dtype=np.intp)
+            for name, s in series.items()
+        }
+
+    def window(self, start: str = None, stop: str = None, last=None) -> slice:
+        return date_window(self._date_keys, start, stop, last)
+
+    def align(self, name, values) -> np.ndarray:
+        """Spreads the columns of a matrix of the series `name` on the axis, NaN where it has no date"""
+        ret = np.full(values.shape[:-1] + (len(self.dates),), np.nan)
+        ret[..., self.positions[name]] = values
+        return ret
+
+
+def combined_entry(axis: DateAxis, series: dict, populations: dict, key, kinds, window: slice) -> dict:
+    """Every kind of series of `key` in each of the `series` by data type, as arrays on the dates of `axis`.
+
+    Missing values (a date one series lacks, an unknown population) are None.
+    """
+    ret = {"dates": axis.dates[window]}
+    for data_type, data in series.items():
+        row = data.rows.get(key)
+        population = data.population_vector(populations) if any(kind in DIGITS for kind in kinds) else None
+        ret[data_type] = {}
+        for kind in kinds:
+            if row is None:
+                values = np.full(len(axis.dates), np.nan)
+            else:
+                values = axis.align(data_type, series_matrix(data, kind, [row], population))[0]
+            cells = values[window].tolist()
+            ret[data_type][kind.replace("_", "-")] = [
+                None if value != value else value if kind in DIGITS else int(value)
+                for value in cells
+            ]
+    return ret
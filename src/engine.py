@@ -0,0 +1,224 @@
+import datetime
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from src.errors import InvalidParameter
+from src.series import parse_date
+
+DATABASE_FPATH = "covid19.db"
+
+SCHEMA = """
+CREATE TABLE countries (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    iso2 TEXT NOT NULL,
+    iso3 TEXT NOT NULL
+);
+CREATE INDEX countries_iso2 ON countries (iso2 COLLATE NOCASE);
+CREATE INDEX countries_iso3 ON countries (iso3 COLLATE NOCASE);
+CREATE TABLE names (
+    document TEXT NOT NULL,
+    name TEXT NOT NULL,
+    country_id INTEGER NOT NULL REFERENCES countries (id),
+    PRIMARY KEY (document, name)
+) WITHOUT ROWID;
+CREATE TABLE regions (
+    id INTEGER PRIMARY KEY,
+    document TEXT NOT NULL,
+    country_id INTEGER NOT NULL REFERENCES countries (id),
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    population REAL
+);
+CREATE INDEX regions_name ON regions (document, country_id, name_lower);
+CREATE TABLE days (
+    day INTEGER PRIMARY KEY,
+    date TEXT NOT NULL UNIQUE
+);
+CREATE TABLE series (
+    data_type TEXT NOT NULL,
+    country_id INTEGER NOT NULL,
+    region_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (data_type, country_id, region_id, day)
+) WITHOUT ROWID;
+"""
+
+
+def day_number(date: str) -> int:
+    """Proleptic ordinal of a "%m/%d/%y" key, so that day ranges are date ranges"""
+    month, day, year = date.split("/")
+    return datetime.date(2000 + int(year), int(month), int(day)).toordinal()
+
+
+def query_day(date: str) -> int:
+    """`day_number` of a `from` / `to` query date"""
+    year, month, day = parse_date(date)
+    try:
+        return datetime.date(2000 + year, month, day).toordinal()
+    except ValueError:
+        raise InvalidParameter(f"Invalid date {date!r}, expected mm/dd/yy or yyyy-mm-dd")
+
+
+def build_database(db_fpath: str, documents, resolvers: dict):
+    """Loads the history and region series into a fresh SQLite database at `db_fpath`.
+
+    `documents` yields `(document, data_type, series)`, `resolvers` holds the
+    `Resolver` of each document: every name it accepts is stored so lookups
+    resolve exactly like the in-memory views. Region series are keyed by
+    their region id, country level series by region id 0.
+    """
+    tmp_fpath = f"{db_fpath}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_fpath):
+        os.unlink(tmp_fpath)
+    with sqlite3.connect(tmp_fpath) as conn:
+        conn.executescript(SCHEMA)
+        countries = {}
+
+        def country_id(name, iso2, iso3):
+            if name not in countries:
+                countries[name] = conn.execute(
+                    "INSERT INTO countries (name, iso2, iso3) VALUES (?, ?, ?)", (name, iso2, iso3)).lastrowid
+            return countries[name]
+
+        for document, data_type, series in documents:
+            days = [day_number(date) for date in series.dates]
+            conn.executemany("INSERT OR IGNORE INTO days (day, date) VALUES (?, ?)", zip(days, series.dates))
+            row_ids = []
+            for i, key in enumerate(series.keys):
+                country = key[0] if series.groups else key
+                cid = country_id(country, series.iso2[i], series.iso3[i])
+                region_id = 0
+                if series.groups:
+                    population = None if np.isnan(series.population[i]) else float(series.population[i])
+                    region_id = conn.execute(
+                        "INSERT INTO regions (document, country_id, name, name_lower, population) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (document, cid, key[1], key[1].lower(), population)).lastrowid
+                row_ids.append((cid, region_id))
+            conn.executemany(
+                "INSERT INTO series (data_type, country_id, region_id, day, value) VALUES (?, ?, ?, ?, ?)",
+                ((data_type, cid, region_id, day, value)
+                 for (cid, region_id), values in zip(row_ids, series.values.tolist())
+                 for day, value in zip(days, values)))
+            conn.executemany(
+                "INSERT INTO names (document, name, country_id) VALUES (?, ?, ?)",
+                ((document, name, countries[key]) for name, key in resolvers[document].names()))
+    os.replace(tmp_fpath, db_fpath)
+
+
+class SQLiteEngine:
+    """Answers the history and region queries from the database of the published snapshot.
+
+    Connections are read-only, one per thread, and reopened when `root`
+    points to a new snapshot.
+    """
+
+    def __init__(self, root: str, db_fpath: str = DATABASE_FPATH):
+        self.root = root
+        self.db_fpath = db_fpath
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        fpath = os.path.join(os.path.realpath(self.root), self.db_fpath)
+        if getattr(self._local, "fpath", None) != fpath:
+            if getattr(self._local, "conn", None) is not None:
+                self._local.conn.close()
+            self._local.conn = sqlite3.connect(f"file:{fpath}?mode=ro", uri=True)
+            self._local.fpath = fpath
+        return self._local.conn
+
+    def resolve(self, document: str, name: str):
+        """Returns `(country_id, name, iso2, iso3)` of the entry `name` resolves to in `document`"""
+        return self.connection().execute(
+            "SELECT c.id, c.name, c.iso2, c.iso3 FROM names n JOIN countries c ON c.id = n.country_id "
+            "WHERE n.document = ? AND n.name = ?", (document, name.lower())).fetchone()
+
+    def resolve_region(self, document: str, country_id: int, region_name: str):
+        """Returns `(region_id, name, population)` of the first region of the country named `region_name`"""
+        return self.connection().execute(
+            "SELECT id, name, population FROM regions WHERE document = ? AND country_id = ? AND name_lower = ? "
+            "ORDER BY id LIMIT 1", (document, country_id, region_name.lower())).fetchone()
+
+    def regions_population(self, document: str, country_id: int):
+        """`(name, population)` of each region of a country, in dataset order, the population None when unknown"""
+        return self.connection().execute(
+            "SELECT name, population FROM regions WHERE document = ? AND country_id = ? ORDER BY id",
+            (document, country_id)).fetchall()
+
+    def days(self, data_type: str, country_id: int, region_id: int, start: str = None, stop: str = None,
+             last=None):
+        """Day numbers bounding the `window` of `TimeSeries.window` over the days of one series"""
+        first = 0 if start is None else query_day(start)
+        end = 2 ** 31 if stop is None else query_day(stop)
+        if last is not None:
+            try:
+                last = int(last)
+            except ValueError:
+                last = -1
+            if last < 0:
+                raise InvalidParameter("last must be a non-negative number of days")
+            if last == 0:
+                return 1, 0
+            row = self.connection().execute(
+                "SELECT day FROM series WHERE data_type = ? AND country_id = ? AND region_id = ? "
+                "AND day BETWEEN ? AND ? ORDER BY day DESC LIMIT 1 OFFSET ?",
+                (data_type, country_id, region_id, first, end, last - 1)).fetchone()
+            if row is not None:
+                first = max(first, row[0])
+        return first, end
+
+    def history(self, data_type: str, country_id: int, region_id: int = 0, start: str = None, stop: str = None,
+                last=None):
+        """Maps the dates of the window of one series to the counts"""
+        first, end = self.days(data_type, country_id, region_id, start, stop, last)
+        rows = self.connection().execute(
+            "SELECT d.date, s.value FROM series s JOIN days d ON d.day = s.day "
+            "WHERE s.data_type = ? AND s.country_id = ? AND s.region_id = ? AND s.day BETWEEN ? AND ? "
+            "ORDER BY s.day",
+            (data_type, country_id, region_id, first, end))
+        return dict(rows)
+
+    def iter_regions_history(self, data_type: str, document: str, country_id: int, start: str = None,
+                             stop: str = None, last=None):
+        """Each region of a country and the window of its history, in dataset order.
+
+        `(region, entry)` pairs read one at a time straight from the cursor. The
+        parameters are checked before returning, only reading the rows is left
+        to the iteration.
+        """
+        conn = self.connection()
+        regions = conn.execute(
+            "SELECT id, name FROM regions WHERE document = ? AND country_id = ? ORDER BY id",
+            (document, country_id)).fetchall()
+        if not regions:
+            return iter(())
+        # The regions of a document share one date axis
+        first, end = self.days(data_type, country_id, regions[0][0], start, stop, last)
+        rows = conn.execute(
+            "SELECT s.region_id, d.date, s.value FROM regions r "
+            "JOIN series s ON s.data_type = ? AND s.country_id = r.country_id AND s.region_id = r.id "
+            "JOIN days d ON d.day = s.day "
+            "WHERE r.document = ? AND r.country_id = ? AND s.day BETWEEN ? AND ? "
+            "ORDER BY r.id, s.day",
+            (data_type, document, country_id, first, end))
+
+        def pairs():
+            remaining = iter(regions)
+            region_id, name = next(remaining)
+            history = {}
+            for row_region_id, date, value in rows:
+                while row_region_id != region_id:
+                    yield name, {"history": history}
+                    region_id, name = next(remaining)
+                    history = {}
+                history[date] = value
+            yield name, {"history": history}
+            # Regions without any day in the window
+            for _, name in remaining:
+                yield name, {"history": {}}
+        return pairs()
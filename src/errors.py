@@ -4,3 +4,11 @@ class RegionNotFound(Exception):
 
 class CountryNotFound(Exception):
     pass
+
+
+class InvalidParameter(Exception):
+    pass
+
+
+class GroupNotFound(Exception):
+    pass
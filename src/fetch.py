@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.manifest import file_digest
+from src.snapshots import atomic_write
+
+
+class FetchResult:
+    def __init__(self, url: str, modified: bool, content: bytes = None):
+        self.url = url
+        self.modified = modified
+        self.content = content
+
+
+class Fetcher:
+    """Upstream downloads over one pooled session.
+
+    Requests are conditional (If-None-Match / If-Modified-Since) using the
+    validators of the last successful fetch, kept in `state_fpath`, and a URL
+    is only requested once per Fetcher however many files it feeds. The state
+    also holds the digest of each document, and is only saved once they are
+    published: a download is "changed" relative to that, never to the working
+    file, which a failed refresh may have overwritten.
+    """
+
+    def __init__(self, state_fpath: str = None, timeout: float = 60, pool_size: int = 8, session=None):
+        self.state_fpath = state_fpath
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=Retry(total=3, backoff_factor=1, status_forcelist=(500, 502, 503, 504)))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.state = self._load_state()
+        self._published = {url: validators.get("digest") for url, validators in self.state.items()}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def _load_state(self) -> dict:
+        if self.state_fpath is None:
+            return {}
+        try:
+            with open(self.state_fpath, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self):
+        """Persists the validators, only once what they describe has been published"""
+        if self.state_fpath is not None:
+            atomic_write(self.state_fpath, json.dumps(self.state))
+
+    def _get(self, url: str, conditional: bool) -> FetchResult:
+        headers = {}
+        validators = self.state.get(url, {})
+        if conditional and validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if conditional and validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        r = self.session.get(url, headers=headers, timeout=self.timeout)
+        if r.status_code == 304:
+            logging.info(f"{url} not modified")
+            return FetchResult(url, False)
+        r.raise_for_status()
+        self.state[url] = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "digest": hashlib.sha256(r.content).hexdigest()
+        }
+        return FetchResult(url, True, r.content)
+
+    def fetch(self, url: str) -> FetchResult:
+        with self._lock:
+            pending = self._results.get(url)
+            if pending is None:
+                pending = self._results[url] = {"done": threading.Event()}
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            pending["done"].wait()
+            if "error" in pending:
+                raise pending["error"]
+            return pending["result"]
+        try:
+            pending["result"] = self._get(url, conditional=True)
+        except Exception as e:
+            pending["error"] = e
+            raise
+        finally:
+            pending["done"].set()
+        return pending["result"]
+
+    def download(self, url: str, fpath: str) -> bool:
+        """Stores `url` in `fpath`, returns whether it differs from the last published fetch"""
+        result = self.fetch(url)
+        published = self._published.get(url)
+        try:
+            current = file_digest(fpath)
+        except FileNotFoundError:
+            current = None
+        if not result.modified:
+            if published is not None and current == published:
+                return False
+            # The working file is not what the validators describe, ask for the whole document again
+            result = self._get(url, conditional=False)
+        digest = hashlib.sha256(result.content).hexdigest()
+        if digest != current:
+            atomic_write(fpath, result.content, binary=True)
+        return digest != published
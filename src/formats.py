@@ -0,0 +1,105 @@
+import csv
+import io
+
+import numpy as np
+
+from src.derive import series_matrix
+from src.stream import dumps
+
+try:
+    import msgpack
+except ImportError:  # MessagePack output is only offered when msgpack is installed
+    msgpack = None
+
+COLUMNAR = "columnar"
+CSV = "csv"
+MSGPACK = "msgpack"
+MIMETYPES = {
+    COLUMNAR: "application/vnd.covid19.columnar+json",
+    CSV: "text/csv",
+    MSGPACK: "application/msgpack"
+}
+if msgpack is None:
+    del MIMETYPES[MSGPACK]
+
+
+class Frame:
+    """Rows of one kind of series sharing a date axis, what the compact formats encode.
+
+    `columns` holds the per row metadata (ISO codes, country of a region)
+    written next to the names.
+    """
+
+    def __init__(self, kind: str, dates, names, values, columns: dict = None):
+        self.kind = kind.replace("_", "-")
+        self.dates = list(dates)
+        self.names = list(names)
+        self.values = values
+        self.columns = columns or {}
+
+    @classmethod
+    def from_series(cls, series, kind: str, rows, population=None, window: slice = None, names=None,
+                    columns: dict = None):
+        """Frame of `rows` (a slice or a list of indexes) of a `TimeSeries`"""
+        indexes = range(len(series.keys))[rows] if isinstance(rows, slice) else rows
+        return cls(kind, series.dates[window or slice(None)],
+                   names if names is not None else [series.keys[i] for i in indexes],
+                   series_matrix(series, kind, rows, population, window),
+                   columns if columns is not None else {
+                       "iso2": [series.iso2[i] for i in indexes],
+                       "iso3": [series.iso3[i] for i in indexes]
+                   })
+
+    @classmethod
+    def from_pairs(cls, kind: str, pairs, columns: dict = None):
+        """Frame of `(name, entry)` pairs already rendered as JSON entries"""
+        key = kind.replace("_", "-")
+        names, rows, dates = [], [], None
+        for name, entry in pairs:
+            names.append(name)
+            if dates is None:
+                dates = list(entry[key])
+            rows.append(list(entry[key].values()))
+        return cls(kind, dates or [], names, np.array(rows, dtype=np.int64).reshape(len(names), len(dates or [])),
+                   columns)
+
+    def cells(self):
+        """Values as nested lists, NaN becoming None"""
+        if self.values.dtype.kind == "f":
+            return [[None if value != value else value for value in row] for row in self.values.tolist()]
+        return self.values.tolist()
+
+    def as_dict(self) -> dict:
+        return {"kind": self.kind, "dates": self.dates, "names": self.names, **self.columns, "values": self.cells()}
+
+
+def columnar(frame: Frame):
+    """One shared `dates` array and one array of numbers per row"""
+    yield dumps(frame.as_dict()) + "\n"
+
+
+def csv_lines(frame: Frame):
+    """A header of the dates then one line per row, unknown values left empty"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["name", *frame.columns, *frame.dates])
+    columns = list(frame.columns.values())
+    for i, row in enumerate(frame.cells()):
+        writer.writerow([frame.names[i], *(column[i] for column in columns),
+                         *("" if value is None else value for value in row)])
+        if buffer.tell() >= 1 << 16:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def packed(frame: Frame):
+    yield msgpack.packb(frame.as_dict())
+
+
+ENCODERS = {
+    COLUMNAR: columnar,
+    CSV: csv_lines,
+    MSGPACK: packed
+}
@@ -0,0 +1,115 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DOWNLOAD = "download"
+PARSE = "parse"
+DERIVE = "derive"
+PUBLISH = "publish"
+STAGES = (DOWNLOAD, PARSE, DERIVE, PUBLISH)
+
+
+class IngestError(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, name: str, fn, stage: str, deps=(), outputs=()):
+        self.name = name
+        self.fn = fn
+        self.stage = stage
+        self.deps = tuple(deps)
+        self.outputs = tuple(outputs)
+
+
+class TaskResult:
+    def __init__(self, name: str, stage: str, changed: bool, skipped: bool, elapsed: float, error=None):
+        self.name = name
+        self.stage = stage
+        self.changed = changed
+        self.skipped = skipped
+        self.elapsed = elapsed
+        self.error = error
+
+
+class Pipeline:
+    """Runs the ingest tasks as a dependency graph on a bounded thread pool.
+
+    A task only starts once all of its dependencies succeeded. A task returns
+    whether it changed its outputs (None counts as changed); when none of its
+    dependencies changed anything it is skipped, after `reuse` was given a
+    chance to carry its outputs over from the previous refresh. A failure
+    cancels everything downstream of it.
+    """
+
+    def __init__(self, max_workers: int = 4, reuse=None):
+        self.max_workers = max_workers
+        self.reuse = reuse
+        self.tasks = {}
+        self.elapsed = 0.0
+
+    def add(self, name: str, fn, stage: str, deps=(), outputs=()) -> Task:
+        for dep in deps:
+            if dep not in self.tasks:
+                raise IngestError(f"{name} depends on unknown task {dep}")
+        self.tasks[name] = Task(name, fn, stage, deps, outputs)
+        return self.tasks[name]
+
+    def _can_skip(self, task: Task, results: dict) -> bool:
+        if not task.deps or any(results[dep].changed for dep in task.deps):
+            return False
+        return self.reuse is None or not task.outputs or self.reuse(task.outputs)
+
+    def _run_task(self, task: Task) -> TaskResult:
+        start = time.perf_counter()
+        try:
+            changed = task.fn()
+        except Exception as e:
+            logging.exception(f"Task {task.name} failed")
+            return TaskResult(task.name, task.stage, True, False, time.perf_counter() - start, e)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Task {task.name} ({task.stage}) done in {elapsed:.3f}s")
+        return TaskResult(task.name, task.stage, changed is not False, False, elapsed)
+
+    def run(self) -> dict:
+        results = {}
+        pending = dict(self.tasks)
+        running = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    if any(dep not in results for dep in task.deps):
+                        continue
+                    del pending[name]
+                    failed = [dep for dep in task.deps if results[dep].error is not None]
+                    if failed:
+                        results[name] = TaskResult(
+                            name, task.stage, True, True, 0.0, IngestError(f"{failed[0]} failed"))
+                    elif self._can_skip(task, results):
+                        logging.info(f"Task {name} ({task.stage}) skipped, inputs unchanged")
+                        results[name] = TaskResult(name, task.stage, False, True, 0.0)
+                    else:
+                        running[pool.submit(self._run_task, task)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        self.elapsed = time.perf_counter() - start
+        self.log_timings(results)
+        return results
+
+    def log_timings(self, results: dict):
+        for stage in STAGES:
+            elapsed = [r.elapsed for r in results.values() if r.stage == stage]
+            if elapsed:
+                logging.info(f"Stage {stage}: {len(elapsed)} tasks, {sum(elapsed):.3f}s of work")
+        logging.info(f"Ingest wall time {self.elapsed:.3f}s, critical path {self.critical_path(results):.3f}s")
+
+    def critical_path(self, results: dict) -> float:
+        longest = {}
+        for name in self.tasks:  # insertion order is a topological order, see `add`
+            task = self.tasks[name]
+            longest[name] = results[name].elapsed + max((longest[dep] for dep in task.deps), default=0.0)
+        return max(longest.values(), default=0.0)
@@ -0,0 +1,59 @@
+import json
+import threading
+import unicodedata
+
+
+def fold(name: str) -> str:
+    """Form names are compared in: NFKD decomposed, ASCII only and lowercased"""
+    return unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("utf-8").lower()
+
+
+class IsoIndex:
+    """ISO 3166 codes by folded country name, aliases taking precedence over `iso-3166.json`.
+
+    Read once per ingest, on first use, and shared by every document built
+    from it. Names without codes are collected by document for the report.
+    """
+
+    def __init__(self, fpath: str, aliases: dict = None):
+        self.fpath = fpath
+        self.aliases = aliases or {}
+        self._entries = None
+        self._codes = None
+        self._unmatched = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._codes is not None:
+                return
+            with open(self.fpath, "r") as f:
+                entries = json.load(f)
+            codes = {fold(iso["name"]): (iso["iso2"], iso["iso3"]) for iso in entries}
+            for alias, special in self.aliases.items():
+                codes[fold(alias)] = (special["iso2"], special["iso3"])
+            self._entries = entries
+            self._codes = codes
+
+    def table(self) -> list:
+        """Entries of the ISO 3166 file, as the `Resolver` takes them"""
+        if self._codes is None:
+            self._load()
+        return self._entries
+
+    def codes(self, name: str, document: str = None):
+        """Returns `(iso2, iso3)` of `name`, empty strings when it has none"""
+        if self._codes is None:
+            self._load()
+        found = self._codes.get(fold(name))
+        if found is not None:
+            return found
+        if document is not None:
+            with self._lock:
+                self._unmatched.setdefault(document, set()).add(name)
+        return "", ""
+
+    def report(self) -> dict:
+        """Names left without ISO codes, by document"""
+        with self._lock:
+            return {document: sorted(names) for document, names in self._unmatched.items()}
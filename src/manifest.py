@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import time
+
+from src.snapshots import atomic_write
+
+MANIFEST_FNAME = "manifest.json"
+
+
+def read_manifest(root: str) -> dict:
+    """Manifest of the snapshot in `root`, an empty generation 0 if there is none yet"""
+    try:
+        with open(os.path.join(root, MANIFEST_FNAME), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0, "digest": manifest_digest({}), "lastUpdate": None, "lastChange": None,
+                "datasets": {}}
+
+
+def file_digest(fpath: str) -> str:
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_digest(digests: dict) -> str:
+    """Content hash of a snapshot, from the digests of its datasets.
+
+    Unlike the generation, which restarts at 1 in every data directory, the
+    same data always hashes the same and different data never does, so it
+    can key anything that outlives a directory (shared caches, ETags).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for dataset, dataset_digest in sorted(digests.items()):
+        digest.update(f"{dataset}\0{dataset_digest}\n".encode())
+    return digest.hexdigest()
+
+
+def publish_manifest(root: str, datasets, previous_root: str) -> dict:
+    """Records the content hash of every dataset and bumps the generation if any of them changed.
+
+    The generation only ever increases, and only when the data does, so
+    anything keyed by it (cache entries, ETags) stays valid exactly as long
+    as the data it was computed from.
+    """
+    previous = read_manifest(previous_root)
+    digests = {}
+    for dataset in datasets:
+        try:
+            digests[dataset] = file_digest(os.path.join(root, dataset))
+        except FileNotFoundError:
+            continue
+    now = int(time.time())
+    manifest = {
+        "generation": previous["generation"],
+        "digest": manifest_digest(digests),
+        "lastUpdate": now,
+        "lastChange": previous["lastChange"],
+        "datasets": digests
+    }
+    if digests != previous["datasets"]:
+        manifest["generation"] += 1
+        manifest["lastChange"] = now
+    atomic_write(os.path.join(root, MANIFEST_FNAME), json.dumps(manifest))
+    return manifest
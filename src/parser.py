@@ -0,0 +1,103 @@
+import csv
+import threading
+import warnings
+
+import numpy as np
+
+
+def is_date(column: str) -> bool:
+    parts = column.split("/")
+    return len(parts) == 3 and all(part.isdigit() for part in parts)
+
+
+def normalize_date(date: str) -> str:
+    """"1/22/20" -> "01/22/20", the key format of the history documents"""
+    month, day, year = date.split("/")
+    return f"{int(month):02d}/{int(day):02d}/{year[-2:]}"
+
+
+def to_int(cell: str) -> int:
+    if cell.isdigit():
+        return int(cell)
+    return int(float(cell)) if cell else 0
+
+
+def to_matrix(cells, width: int) -> np.ndarray:
+    """int64 `len(cells) x width` matrix of rows of raw CSV cells.
+
+    The cells are joined back and read by numpy in one go; when some of them
+    are empty or decimal numpy stops early and the rows go through `to_int`
+    cell by cell instead.
+    """
+    text = ",".join(",".join(row) for row in cells)
+    if text:
+        try:
+            with warnings.catch_warnings():
+                # Older numpy only warns about the unmatched data
+                warnings.simplefilter("error", DeprecationWarning)
+                values = np.fromstring(text, dtype=np.int64, sep=",")
+            if values.size == len(cells) * width:
+                return values.reshape(len(cells), width)
+        except (ValueError, DeprecationWarning):
+            pass
+    return np.array([[to_int(cell) for cell in row] for row in cells], dtype=np.int64).reshape(len(cells), width)
+
+
+class TimeSeriesCSV:
+    """Raw rows of a JHU time series CSV, split once between metadata and date cells.
+
+    The date columns are found from the header whatever the number of metadata
+    columns before them (4 in the global files, 11 or 12 in the US ones) and
+    their keys are parsed once for the whole file.
+    """
+
+    def __init__(self, header, dates, meta, cells):
+        self.header = header
+        self.dates = dates
+        self.meta = meta
+        self.cells = cells
+
+    @classmethod
+    def read(cls, csv_fpath: str):
+        with open(csv_fpath, "r", newline="") as csv_file:
+            reader = csv.reader(csv_file)
+            header = next(reader)
+            start = next(j for j, column in enumerate(header) if is_date(column))
+            meta, cells = [], []
+            for row in reader:
+                if row:
+                    meta.append(tuple(row[:start]))
+                    cells.append(row[start:])
+        return cls(header[:start], [normalize_date(column) for column in header[start:]], meta, cells)
+
+    def column(self, name: str):
+        j = self.header.index(name)
+        return [row[j] for row in self.meta]
+
+    def values(self) -> np.ndarray:
+        return to_matrix(self.cells, len(self.dates))
+
+
+def parse_time_series(csv_fpath: str):
+    """Returns the metadata header, the dates, the metadata rows and the int64 `rows x dates` values"""
+    table = TimeSeriesCSV.read(csv_fpath)
+    return table.header, table.dates, table.meta, table.values()
+
+
+class SharedParser:
+    """Parses each time series CSV once per refresh, however many ingest tasks read it"""
+
+    def __init__(self):
+        self._parsed = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def parse(self, csv_fpath: str):
+        """Returns the `TimeSeriesCSV` of `csv_fpath` and its int64 `rows x dates` values"""
+        with self._lock:
+            lock = self._locks.setdefault(csv_fpath, threading.Lock())
+        with lock:
+            if csv_fpath not in self._parsed:
+                table = TimeSeriesCSV.read(csv_fpath)
+                self._parsed[csv_fpath] = table, table.values()
+            return self._parsed[csv_fpath]
@@ -0,0 +1,72 @@
+import csv
+import threading
+
+import numpy as np
+
+from src.rollup import GeoTree, Rollup
+
+
+def to_population(cell: str) -> float:
+    """Population of a lookup table cell, NaN when it is blank"""
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
+
+
+class PopulationIndex:
+    """Populations of the JHU UID lookup table (UID_ISO_FIPS_LookUp_Table.csv).
+
+    Rows are indexed by UID, which the US time series carry for every county,
+    and by `(Country_Region, Province_State)` for the provinces and states
+    of the other time series. The table is read once, on first use.
+    """
+
+    def __init__(self, fpath: str):
+        self.fpath = fpath
+        self._by_uid = None
+        self._by_region = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._by_uid is not None:
+                return
+            by_uid, by_region = {}, {}
+            with open(self.fpath, "r", newline="") as f:
+                for row in csv.DictReader(f):
+                    population = to_population(row["Population"])
+                    try:
+                        by_uid[int(row["UID"])] = population
+                    except ValueError:
+                        pass
+                    if row["Province_State"] and not row["Admin2"]:
+                        by_region[row["Country_Region"], row["Province_State"]] = population
+            self._by_region = by_region
+            self._by_uid = by_uid
+
+    def by_uids(self, uids) -> np.ndarray:
+        """Population of each UID (given as CSV cells), NaN when it is unknown"""
+        self._load()
+        ret = np.full(len(uids), np.nan)
+        for i, uid in enumerate(uids):
+            try:
+                ret[i] = self._by_uid.get(int(float(uid)), np.nan)
+            except ValueError:
+                continue
+        return ret
+
+    def by_regions(self, keys) -> np.ndarray:
+        """Population of each `(country, province)` pair, NaN when it is unknown"""
+        self._load()
+        return np.array([self._by_region.get(key, np.nan) for key in keys], dtype=np.float64)
+
+
+def rollup_population(tree: GeoTree, population: np.ndarray, groups: dict = None) -> Rollup:
+    """Sums the populations of the leaves of `tree` like the counts, NaN for a node without any known population"""
+    known = ~np.isnan(population)
+    totals = Rollup(tree, np.where(known, population, 0), groups)
+    counts = Rollup(tree, known.astype(np.int64), groups)
+    for total, count in zip(totals.levels + [totals.group_sums], counts.levels + [counts.group_sums]):
+        total[count == 0] = np.nan
+    return totals
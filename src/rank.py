@@ -0,0 +1,89 @@
+import numpy as np
+
+from src.derive import DIGITS, series_matrix
+from src.errors import InvalidParameter
+
+ORDERS = ("desc", "asc")
+DEFAULT_N = 10
+MAX_N = 500
+# Fields of data.json that are not counts
+IGNORED_FIELDS = ("lastUpdate",)
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def record_fields(records) -> list:
+    """Numeric fields of the data.json records, in order of appearance"""
+    fields = {}
+    for record in records:
+        for field, value in record.items():
+            if is_number(value) and field not in IGNORED_FIELDS:
+                fields.setdefault(field, None)
+    return list(fields)
+
+
+def parse_top(n, order):
+    """Validated `n` and `order` query parameters of a ranking"""
+    try:
+        n = DEFAULT_N if n is None else int(n)
+    except ValueError:
+        n = 0
+    if not 1 <= n <= MAX_N:
+        raise InvalidParameter(f"n must be between 1 and {MAX_N}")
+    order = order or ORDERS[0]
+    if order not in ORDERS:
+        raise InvalidParameter(f"Unknown order {order!r}, expected one of {', '.join(ORDERS)}")
+    return n, order
+
+
+class Ranking:
+    """Rows of one metric sorted both ways once, so a top N query only slices the first N indexes.
+
+    Rows without a value (NaN) are left out, ties keep the dataset order.
+    """
+
+    def __init__(self, names, iso2, iso3, values, integer: bool = True, date: str = None):
+        self.names = list(names)
+        self.iso2 = list(iso2)
+        self.iso3 = list(iso3)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.integer = integer
+        self.date = date
+        known = np.flatnonzero(~np.isnan(self.values))
+        self.orders = {
+            "desc": known[np.argsort(-self.values[known], kind="stable")],
+            "asc": known[np.argsort(self.values[known], kind="stable")]
+        }
+
+    @classmethod
+    def from_records(cls, records, field: str):
+        """Ranking of the data.json records by one of their fields"""
+        values = [record.get(field) for record in records]
+        return cls([record.get("country") for record in records],
+                   [record.get("iso2", "") for record in records],
+                   [record.get("iso3", "") for record in records],
+                   [value if is_number(value) else np.nan for value in values],
+                   all(isinstance(value, int) for value in values if is_number(value)))
+
+    @classmethod
+    def from_series(cls, series, kind: str, population):
+        """Ranking of the latest value of a history series rendered as `kind`"""
+        last = slice(len(series.dates) - 1, len(series.dates))
+        return cls(series.keys, series.iso2, series.iso3,
+                   series_matrix(series, kind, slice(None), population, last)[:, 0].astype(np.float64),
+                   kind not in DIGITS, series.dates[-1] if series.dates else None)
+
+    def top(self, n: int, order: str = "desc") -> list:
+        ret = []
+        for rank, i in enumerate(self.orders[order][:n].tolist(), 1):
+            value = self.values[i]
+            ret.append({
+                "rank": rank,
+                "name": self.names[i],
+                "iso2": self.iso2[i],
+                "iso3": self.iso3[i],
+                "value": int(value) if self.integer else float(value)
+            })
+        return ret
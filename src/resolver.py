@@ -0,0 +1,64 @@
+class Resolver:
+    """Case insensitive lookup of a dataset entry by name, ISO2, ISO3 or alias.
+
+    Built once per dataset generation so a lookup (hit or miss) is a single
+    dict access instead of a `pattern_match` scan over every country.
+    """
+
+    def __init__(self, entries, iso_data=(), aliases=None):
+        """`entries` yields `(key, name, iso2, iso3, regions)` in dataset order"""
+        self._index = {}
+        self._regions = {}
+        by_iso3 = {}
+        for key, name, iso2, iso3, regions in entries:
+            for pattern in (name, iso2, iso3):
+                if pattern:
+                    self._index.setdefault(pattern.lower(), key)
+            if iso3:
+                by_iso3.setdefault(iso3.upper(), key)
+            if regions is not None:
+                self._regions[key] = {region.lower(): region for region in reversed(list(regions))}
+        for iso in iso_data:
+            key = by_iso3.get(iso["iso3"].upper())
+            if key is not None:
+                self._index.setdefault(iso["name"].lower(), key)
+        for alias, special in (aliases or {}).items():
+            key = self._index.get(special["name"].lower())
+            if key is not None:
+                self._index.setdefault(alias.lower(), key)
+
+    @classmethod
+    def from_document(cls, data, iso_data=(), aliases=None):
+        if isinstance(data, list):
+            entries = (
+                (i, d.get("country"), d.get("iso2"), d.get("iso3"), None)
+                for i, d in enumerate(data))
+        else:
+            entries = (
+                (k, k, v.get("iso2"), v.get("iso3"), v.get("regions"))
+                for k, v in data.items())
+        return cls(entries, iso_data, aliases)
+
+    @classmethod
+    def from_series(cls, series, iso_data=(), aliases=None):
+        """Same as `from_document` for the `TimeSeries` of a history or region document"""
+        if series.groups:
+            entries = (
+                (country, country, series.iso2[rows.start], series.iso3[rows.start],
+                 [region for _, region in series.keys[rows]])
+                for country, rows in series.groups.items())
+        else:
+            entries = (
+                (key, key, series.iso2[i], series.iso3[i], None)
+                for i, key in enumerate(series.keys))
+        return cls(entries, iso_data, aliases)
+
+    def names(self):
+        """Yields every lowercased pattern and the key it resolves to"""
+        return iter(self._index.items())
+
+    def resolve(self, name: str):
+        return self._index.get(name.lower())
+
+    def resolve_region(self, key, region_name: str):
+        return self._regions.get(key, {}).get(region_name.lower())
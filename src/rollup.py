@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class GeoTree:
+    """Geography tree (world, country, province/state, county) over leaf rows identified by their path.
+
+    Paths all have the depth of the tree, like `(country, province)` or
+    `(country, state, county)`, the root being the empty path. Nodes are
+    numbered depth first, the children of a node in the order they first
+    appear, so once the leaves are in `order` the ones under any node are
+    contiguous and the sums of a level are one segmented reduction of the
+    level below.
+    """
+
+    def __init__(self, paths):
+        paths = [tuple(path) for path in paths]
+        self.depth = len(paths[0]) if paths else 0
+        ids = []
+        for depth in range(1, self.depth + 1):
+            numbers = {}
+            ids.append(np.array([numbers.setdefault(path[:depth], len(numbers)) for path in paths], dtype=np.intp))
+        # lexsort sorts on its last key first
+        self.order = np.lexsort(ids[::-1]) if ids else np.arange(len(paths))
+        self.nodes = [[()]]
+        self._starts = [None]
+        for depth in range(1, self.depth + 1):
+            self.nodes.append([])
+            self._starts.append([])
+        below = [paths[i] for i in self.order]
+        for depth in range(self.depth, 0, -1):
+            nodes, starts = self.nodes[depth], self._starts[depth]
+            for i, path in enumerate(below):
+                if not nodes or nodes[-1] != path[:depth]:
+                    nodes.append(path[:depth])
+                    starts.append(i)
+            below = nodes
+        self.index = {path: (depth, i) for depth, nodes in enumerate(self.nodes) for i, path in enumerate(nodes)}
+
+    def reduce(self, values) -> list:
+        """Sums of the rows of `values` (aligned with the leaves) for every node, one array per depth from the root"""
+        values = np.asarray(values)
+        if not len(self.order):
+            return [np.zeros((len(nodes),) + values.shape[1:], dtype=values.dtype) for nodes in self.nodes]
+        levels = [values[self.order]]
+        for depth in range(self.depth, 0, -1):
+            levels.append(np.add.reduceat(levels[-1], self._starts[depth], axis=0))
+        levels.append(levels[-1].sum(axis=0, keepdims=True))
+        # The leaves themselves are not a level, several rows may share a path
+        return levels[:0:-1]
+
+
+class Rollup:
+    """Sums of one matrix precomputed at every node of a `GeoTree`, and at custom groups of its nodes.
+
+    `groups` maps a name to the paths of its members, like the countries of a
+    continent or of the EU. Members need not be contiguous in the tree and
+    groups may overlap, so they are summed through a membership matrix
+    rather than `reduceat`; paths missing from the tree are left out. Any node
+    or group is then a lookup.
+    """
+
+    def __init__(self, tree: GeoTree, values, groups: dict = None):
+        self.tree = tree
+        self.levels = tree.reduce(values)
+        groups = groups or {}
+        self.members = {
+            name: [tuple(path) for path in paths if tuple(path) in tree.index]
+            for name, paths in groups.items()
+        }
+        self._groups = {name: g for g, name in enumerate(self.members)}
+        self.group_sums = np.zeros((len(self.members),) + self.levels[0].shape[1:], dtype=self.levels[0].dtype)
+        for depth, level in enumerate(self.levels):
+            membership = np.zeros((len(self.members), len(level)), dtype=level.dtype)
+            for g, paths in enumerate(self.members.values()):
+                for path in paths:
+                    if tree.index[path][0] == depth:
+                        membership[g, tree.index[path][1]] = 1
+            if membership.any():
+                self.group_sums += np.tensordot(membership, level, axes=1)
+
+    def node(self, path=()) -> np.ndarray:
+        """Sums under the node at `path`, the world by default"""
+        depth, i = self.tree.index[tuple(path)]
+        return self.levels[depth][i]
+
+    def level(self, depth: int):
+        """Paths of the nodes at `depth` and their sums, in tree order"""
+        return self.tree.nodes[depth], self.levels[depth]
+
+    def group(self, name: str) -> np.ndarray:
+        return self.group_sums[self._groups[name]]
@@ -0,0 +1,161 @@
+import datetime
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from src.errors import InvalidParameter
+
+
+def date_sort_key(date: str):
+    """Sort key for the "%m/%d/%y" history keys without going through strptime"""
+    month, day, year = date.split("/")
+    return int(year), int(month), int(day)
+
+
+def parse_date(date: str):
+    """`date_sort_key` of a query date, either mm/dd/yy like the history keys or ISO yyyy-mm-dd"""
+    try:
+        if "-" in date:
+            year, month, day = date.split("-")
+            key = int(year) - 2000, int(month), int(day)
+        else:
+            key = date_sort_key(date)
+        # Only the dates of the 2000s, and only ones that exist
+        if not 0 <= key[0] <= 99:
+            raise ValueError(f"year out of range in {date!r}")
+        datetime.date(2000 + key[0], key[1], key[2])
+    except ValueError:
+        raise InvalidParameter(f"Invalid date {date!r}, expected mm/dd/yy or yyyy-mm-dd")
+    return key
+
+
+def date_window(date_keys, start: str = None, stop: str = None, last=None) -> slice:
+    """Slice of the sorted `date_keys` between the `start` and `stop` dates (inclusive), the `last` ones if given"""
+    first = 0 if start is None else bisect_left(date_keys, parse_date(start))
+    end = len(date_keys) if stop is None else bisect_right(date_keys, parse_date(stop))
+    if last is not None:
+        try:
+            last = int(last)
+        except ValueError:
+            last = -1
+        if last < 0:
+            raise InvalidParameter("last must be a non-negative number of days")
+        first = max(first, end - last)
+    return slice(min(first, end), end)
+
+
+class TimeSeries:
+    """Columnar view of a history document.
+
+    `values` is a `len(keys) x len(dates)` int64 matrix sharing one date axis,
+    row `i` holding the cumulative counts of `keys[i]`. Region documents are
+    flattened the same way with `(country, region)` keys, `groups` mapping each
+    country to the slice of its regions. `population` is aligned with the rows,
+    NaN where it is unknown.
+    """
+
+    def __init__(self, dates, keys, values, iso2, iso3, groups=None, population=None):
+        self.dates = list(dates)
+        self.keys = list(keys)
+        self.values = values
+        self.iso2 = list(iso2)
+        self.iso3 = list(iso3)
+        self.groups = groups or {}
+        if population is None:
+            population = np.full(len(self.keys), np.nan)
+        self.population = np.asarray(population, dtype=np.float64)
+        self.rows = {key: i for i, key in enumerate(self.keys)}
+        self._date_keys = [date_sort_key(date) for date in self.dates]
+
+    @staticmethod
+    def _matrix(histories):
+        seen = set()
+        for history in histories:
+            seen.update(history.keys())
+        dates = sorted(seen, key=date_sort_key)
+        columns = {date: j for j, date in enumerate(dates)}
+        values = np.zeros((len(histories), len(dates)), dtype=np.int64)
+        for i, history in enumerate(histories):
+            if list(history) == dates:
+                values[i] = list(history.values())
+            else:
+                for date, value in history.items():
+                    values[i, columns[date]] = value
+        return dates, values
+
+    @classmethod
+    def from_history(cls, data: dict):
+        keys = list(data.keys())
+        dates, values = cls._matrix([data[k]["history"] for k in keys])
+        return cls(dates, keys, values,
+                   [data[k].get("iso2", "") for k in keys],
+                   [data[k].get("iso3", "") for k in keys])
+
+    @classmethod
+    def from_regions(cls, data: dict):
+        keys, histories, iso2, iso3, groups, population = [], [], [], [], {}, []
+        for country, entry in data.items():
+            start = len(keys)
+            for region, region_entry in entry["regions"].items():
+                keys.append((country, region))
+                histories.append(region_entry["history"])
+                population.append(region_entry.get("population", np.nan))
+                iso2.append(entry.get("iso2", ""))
+                iso3.append(entry.get("iso3", ""))
+            groups[country] = slice(start, len(keys))
+        dates, values = cls._matrix(histories)
+        return cls(dates, keys, values, iso2, iso3, groups, population)
+
+    @classmethod
+    def from_document(cls, data):
+        """Builds the columnar form of a history or region document, None otherwise"""
+        if not isinstance(data, dict) or not data:
+            return None
+        first = next(iter(data.values()))
+        if "history" in first:
+            return cls.from_history(data)
+        if "regions" in first:
+            return cls.from_regions(data)
+        return None
+
+    def window(self, start: str = None, stop: str = None, last=None) -> slice:
+        """Columns between the `start` and `stop` dates (inclusive), the `last` ones of them if given"""
+        return date_window(self._date_keys, start, stop, last)
+
+    def daily(self, values=None, window: slice = None) -> np.ndarray:
+        """Day over day change, only over the columns of `window` if given"""
+        values = self.values if values is None else values
+        if window is None or window.start == 0:
+            return np.diff(values[..., window or slice(None)], axis=-1, prepend=0)
+        return np.diff(values[..., window.start - 1:window.stop], axis=-1)
+
+    def total(self) -> np.ndarray:
+        return self.values.sum(axis=0)
+
+    def population_vector(self, populations: dict) -> np.ndarray:
+        """Population of each row aligned with `values`, NaN when it is unknown"""
+        return np.array(
+            [float(populations[iso3]) if iso3 in populations else np.nan for iso3 in self.iso3],
+            dtype=np.float64)
+
+    def per_capita(self, values, population) -> np.ndarray:
+        """Percentage of `population` for each cell, broadcasting a vector over the rows.
+
+        NaN where the population is unknown or zero, without a division warning.
+        """
+        population = np.asarray(population, dtype=np.float64)
+        if population.ndim == 1 and values.ndim == 2:
+            population = population[:, None]
+        ratio = np.full(np.broadcast(values, population).shape, np.nan)
+        np.divide(values, population, out=ratio, where=population > 0)
+        return ratio * 100
+
+    def as_dict(self, row, window: slice = None) -> dict:
+        """Maps the date axis, or the dates of `window` when `row` only holds those, to a 1-D array of numbers"""
+        dates = self.dates if window is None else self.dates[window]
+        return dict(zip(dates, row.tolist()))
+
+    def as_formatted_dict(self, row, digits: int, window: slice = None) -> dict:
+        """Same as `as_dict` for percentages rendered with a fixed number of digits"""
+        dates = self.dates if window is None else self.dates[window]
+        return {date: f"{value:.{digits}f}" for date, value in zip(dates, row.tolist())}
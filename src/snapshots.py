@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import time
+
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_DIR = "current"
+KEEP_SNAPSHOTS = 3
+# Read once at import, os.umask can only be read by setting it
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+def atomic_write(fpath: str, data, binary: bool = False):
+    """Writes `data` to a temporary file, fsyncs it and renames it over `fpath`.
+
+    Readers either see the previous content or the new one, never a
+    truncated file. The file gets the permissions `open` would give it,
+    not the owner only ones of `mkstemp`, so the API can read it when it
+    runs as another user.
+    """
+    dirname = os.path.dirname(fpath) or "."
+    fd, tmp_fpath = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            os.fchmod(f.fileno(), 0o644 & ~UMASK)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_fpath, fpath)
+    except BaseException:
+        try:
+            os.unlink(tmp_fpath)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def fsync_dir(dirname: str):
+    fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def new_snapshot() -> str:
+    """Creates the directory the outputs of one refresh are staged in"""
+    os.makedirs(SNAPSHOTS_DIR, exist_ok=True)
+    snapshot_dir = tempfile.mkdtemp(dir=SNAPSHOTS_DIR, prefix=time.strftime("%Y%m%d%H%M%S-"))
+    os.chmod(snapshot_dir, 0o755)
+    return snapshot_dir
+
+
+def publish_snapshot(snapshot_dir: str):
+    """Atomically points `CURRENT_DIR` at `snapshot_dir` and prunes old snapshots"""
+    for dirpath, _, _ in os.walk(snapshot_dir):
+        fsync_dir(dirpath)
+    tmp_link = f"{CURRENT_DIR}.tmp-{os.getpid()}"
+    if os.path.lexists(tmp_link):
+        os.unlink(tmp_link)
+    os.symlink(snapshot_dir, tmp_link)
+    os.replace(tmp_link, CURRENT_DIR)
+    fsync_dir(os.path.dirname(os.path.abspath(CURRENT_DIR)))
+    prune_snapshots(keep=os.path.realpath(snapshot_dir))
+
+
+def prune_snapshots(keep: str):
+    """Removes all but the `KEEP_SNAPSHOTS` most recent snapshots, readers of older ones are done by then"""
+    snapshots = sorted(
+        (os.path.join(SNAPSHOTS_DIR, name) for name in os.listdir(SNAPSHOTS_DIR)),
+        key=os.path.getmtime, reverse=True)
+    for snapshot_dir in snapshots[KEEP_SNAPSHOTS:]:
+        if os.path.realpath(snapshot_dir) != keep:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from src.columnar import load_columnar
+from src.manifest import manifest_digest
+from src.resolver import Resolver
+from src.series import TimeSeries
+
+
+class Snapshot:
+    """One fully loaded generation of the dataset files, never mutated once published.
+
+    Structures derived from the datasets (see `cached`) live as long as the
+    generation they were built from.
+    """
+
+    def __init__(self, signature, documents: dict, resolvers: dict, series: dict, blobs: dict):
+        self.signature = signature
+        self.documents = documents
+        self.resolvers = resolvers
+        self.series = series
+        self.blobs = blobs
+        self._cached = {}
+        # Reentrant: a build may use other cached structures
+        self._lock = threading.RLock()
+
+    @property
+    def digest(self) -> str:
+        """Content hash of the data, the key of anything derived from it outside this process"""
+        if self.signature[0] is not None:
+            return self.signature[0]
+        return hashlib.sha1(repr(self.signature).encode()).hexdigest()[:12]
+
+    @property
+    def generation(self) -> str:
+        if self.signature[1] is not None:
+            return self.signature[1]
+        return self.digest
+
+    def get(self, fpath: str):
+        if fpath not in self.documents:
+            raise FileNotFoundError(f"[Errno 2] No such file or directory: '{fpath}'")
+        return self.documents[fpath]
+
+    def resolver(self, fpath: str) -> Resolver:
+        if fpath not in self.resolvers:
+            raise FileNotFoundError(f"[Errno 2] No such file or directory: '{fpath}'")
+        return self.resolvers[fpath]
+
+    def blob(self, fpath: str) -> str:
+        """Path of a file served as is, in the directory of this snapshot"""
+        if fpath not in self.blobs:
+            raise FileNotFoundError(f"[Errno 2] No such file or directory: '{fpath}'")
+        return self.blobs[fpath]
+
+    def timeseries(self, fpath: str) -> TimeSeries:
+        if fpath not in self.series:
+            raise FileNotFoundError(f"[Errno 2] No such file or directory: '{fpath}'")
+        return self.series[fpath]
+
+    def cached(self, key, build):
+        """What `build()` returns, built once for this generation on first use"""
+        with self._lock:
+            if key not in self._cached:
+                self._cached[key] = build()
+            return self._cached[key]
+
+
+class DatasetStore:
+    """Process-wide cache of the JSON files produced by `src/utils.py`.
+
+    Files are read from `root`, usually the symlink to the published snapshot
+    directory, parsed once and kept in memory until the manifest generation (or
+    their mtimes, without a manifest) changes. A reload resolves the symlink
+    once and builds a complete new snapshot from that directory before swapping
+    it in, so readers always see a single consistent generation. A directory
+    published with the same generation but different data (a swapped data
+    dir) is told apart by the content digest of its manifest.
+
+    A file listed in `columnar` (JSON path -> binary path) is only available
+    as a `TimeSeries` mapped from its binary twin, its JSON document is not
+    loaded unless the twin is missing. The `blobs` are not loaded either,
+    the snapshot only keeps their path in the resolved directory.
+    """
+
+    def __init__(self, root: str, files, marker: str, iso_fpath: str = None, aliases: dict = None,
+                 blobs=(), columnar: dict = None, check_interval: float = 5.0):
+        self.root = root
+        self.files = list(files)
+        self.blob_files = list(blobs)
+        self.columnar = dict(columnar or {})
+        self.marker = marker
+        self.iso_fpath = iso_fpath
+        self.aliases = aliases
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _signature(self):
+        """Returns the signature of the published data and the directory it lives in"""
+        base = os.path.realpath(self.root)
+        try:
+            with open(os.path.join(base, self.marker), "r") as f:
+                manifest = json.load(f)
+            # Manifests published before the digest was recorded
+            digest = manifest.get("digest") or manifest_digest(manifest["datasets"])
+            return (digest, str(manifest["generation"]), ()), base
+        except FileNotFoundError:
+            pass
+        mtimes = []
+        for fpath in self.files + list(self.columnar.values()) + self.blob_files:
+            try:
+                mtimes.append(os.stat(os.path.join(base, fpath)).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return (None, None, tuple(mtimes)), base
+
+    def _load(self, signature, base: str) -> Snapshot:
+        iso_data = []
+        if self.iso_fpath is not None:
+            with open(self.iso_fpath, "r") as f:
+                iso_data = json.load(f)
+        documents, resolvers, series = {}, {}, {}
+        for fpath in self.files:
+            try:
+                if fpath in self.columnar and os.path.exists(os.path.join(base, self.columnar[fpath])):
+                    series[fpath] = load_columnar(os.path.join(base, self.columnar[fpath]))
+                    resolvers[fpath] = Resolver.from_series(series[fpath], iso_data, self.aliases)
+                    continue
+                with open(os.path.join(base, fpath), "r") as f:
+                    documents[fpath] = json.load(f)
+            except FileNotFoundError:
+                continue
+            resolvers[fpath] = Resolver.from_document(documents[fpath], iso_data, self.aliases)
+            series[fpath] = TimeSeries.from_document(documents[fpath])
+        blobs = {
+            fpath: os.path.join(base, fpath)
+            for fpath in self.blob_files
+            if os.path.exists(os.path.join(base, fpath))
+        }
+        return Snapshot(signature, documents, resolvers, series, blobs)
+
+    def snapshot(self) -> Snapshot:
+        current = self._snapshot
+        now = time.monotonic()
+        if current is not None and now - self._checked_at < self.check_interval:
+            return current
+        with self._lock:
+            current = self._snapshot
+            if current is not None and now - self._checked_at < self.check_interval:
+                return current
+            signature, base = self._signature()
+            if current is None or signature != current.signature:
+                try:
+                    current = self._load(signature, base)
+                    self._snapshot = current
+                except ValueError as e:
+                    # A file is being rewritten, keep serving the previous snapshot
+                    logging.warning(f"Dataset reload failed : {type(e).__name__} : {e}")
+                    if current is None:
+                        raise
+            self._checked_at = time.monotonic()
+        return current
+
+    @property
+    def generation(self) -> str:
+        return self.snapshot().generation
+
+    @property
+    def digest(self) -> str:
+        return self.snapshot().digest
+
+    def get(self, fpath: str):
+        return self.snapshot().get(fpath)
+
+    def resolver(self, fpath: str) -> Resolver:
+        return self.snapshot().resolver(fpath)
+
+    def timeseries(self, fpath: str) -> TimeSeries:
+        return self.snapshot().timeseries(fpath)
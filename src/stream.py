@@ -0,0 +1,48 @@
+import json
+
+CHUNK_SIZE = 1 << 16
+
+
+def dumps(data) -> str:
+    """Same text as `flask.jsonify` produces outside of debug mode, without the trailing newline"""
+    return json.dumps(data, separators=(",", ":"))
+
+
+def chunked(parts, size: int = CHUNK_SIZE):
+    """Joins small string (or bytes) parts into chunks of about `size` characters"""
+    buffer, length = [], 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield part[:0].join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+
+def json_object(pairs):
+    """Streams `(key, value)` pairs as the text of one JSON object, byte for byte what `jsonify` sends"""
+    yield "{"
+    for i, (key, value) in enumerate(pairs):
+        yield ("," if i else "") + dumps(key) + ":" + dumps(value)
+    yield "}\n"
+
+
+def json_array(items):
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + dumps(item)
+    yield "]\n"
+
+
+def ndjson_lines(items):
+    """One JSON document per line"""
+    for item in items:
+        yield dumps(item) + "\n"
+
+
+def named(pairs):
+    """`(key, entry)` pairs as NDJSON documents, the key going to the `name` field"""
+    for key, entry in pairs:
+        yield {"name": key, **entry}
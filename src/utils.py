@@ -1,42 +1,105 @@
-import csv
-import datetime
 import json
+import os
+import shutil
 import sqlite3
 import time
 import unicodedata
 from functools import wraps
-import threading
 
-import requests
 from decouple import config
 from flask import jsonify, request, Response
 import logging
+import numpy as np
+
+from src.bodies import BODIES_DIR, ENCODINGS, body_fpath, collection_bodies, compress, serialize
+from src.columnar import columnar_fpath, load_columnar, write_columnar
+from src.derive import DERIVED_SUFFIXES, derive, derived_fpath
+from src.engine import DATABASE_FPATH, build_database
+from src.fetch import Fetcher
+from src.ingest import DERIVE, DOWNLOAD, PARSE, PUBLISH, IngestError, Pipeline
+from src.iso import IsoIndex
+from src.manifest import publish_manifest
+from src.parser import SharedParser
+from src.population import PopulationIndex, rollup_population
+from src.resolver import Resolver
+from src.rollup import GeoTree, Rollup
+from src.series import TimeSeries, date_sort_key
+from src.snapshots import CURRENT_DIR, atomic_write, new_snapshot, publish_snapshot
 
 logging.basicConfig(filename='api.log', filemode='w', format='%(name)s - %(levelname)s - %(message)s')
 
 AUTHORIZATION = config("Authorization")
-
-APIFY_URL = "https://api.apify.com/v2/key-value-stores/SmuuI0oebnTWjRTUh/records/LATEST?disableRedirect=true"
-CSV_CONFIRMED = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv"
-CSV_DEATHS = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv"
-CSV_RECOVERED = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv"
-
-CSV_CONFIRMED_US = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv"
-CSV_DEATHS_US = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv"
-CSV_RECOVERED_US = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv"
+INGEST_WORKERS = config("INGEST_WORKERS", default=4, cast=int)
+
+# Both overridable so the ingest can run against a local stand-in server
+APIFY_URL = config(
+    "APIFY_URL",
+    default="https://api.apify.com/v2/key-value-stores/SmuuI0oebnTWjRTUh/records/LATEST?disableRedirect=true")
+JHU_TIME_SERIES_URL = config(
+    "JHU_TIME_SERIES_URL",
+    default="https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series")
+CSV_CONFIRMED = f"{JHU_TIME_SERIES_URL}/time_series_covid19_confirmed_global.csv"
+CSV_DEATHS = f"{JHU_TIME_SERIES_URL}/time_series_covid19_deaths_global.csv"
+CSV_RECOVERED = f"{JHU_TIME_SERIES_URL}/time_series_covid19_recovered_global.csv"
+
+CSV_CONFIRMED_US = f"{JHU_TIME_SERIES_URL}/time_series_covid19_confirmed_US.csv"
+CSV_DEATHS_US = f"{JHU_TIME_SERIES_URL}/time_series_covid19_deaths_US.csv"
+# JHU does not publish recovered cases for the US, this is the global file again
+CSV_RECOVERED_US = f"{JHU_TIME_SERIES_URL}/time_series_covid19_recovered_global.csv"
+# Populations of the provinces, states and counties, by UID
+CSV_UID_LOOKUP = config(
+    "JHU_UID_LOOKUP_URL",
+    default="https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/UID_ISO_FIPS_LookUp_Table.csv")
 
 CSV_CONFIRMED_FPATH_US = "csv_confirmed_us.csv"
 CSV_DEATHS_FPATH_US = "csv_deaths_us.csv"
-CSV_RECOVERED_FPATH_US = "csv_deaths_us.csv"
+CSV_RECOVERED_FPATH_US = "csv_recovered_us.csv"
 
 CSV_CONFIRMED_FPATH = "csv_confirmed.csv"
 CSV_DEATHS_FPATH = "csv_deaths.csv"
 CSV_RECOVERD_FPATH = "csv_recovered.csv"
+CSV_UID_LOOKUP_FPATH = "csv_uid_lookup.csv"
+
+APIFY_FPATH = "apify.json"
+FETCH_STATE_FPATH = "fetch_state.json"
 
 CSV_POPULATIONS = "data/populations.csv"
+# Custom groups of countries (continents, the EU...) by name, members by ISO3
+GROUPS_FPATH = "data/groups.json"
+ISO_FPATH = "iso-3166.json"
+# Names left without ISO codes by the last ingest, by document
+ISO_REPORT_FPATH = "iso_unmatched.json"
+
+DATA_TYPES = ("confirmed", "deaths", "recovered")
+DERIVED_FILES = [
+    derived_fpath(f"csv_{data_type}.json", suffix) for data_type in DATA_TYPES for suffix in DERIVED_SUFFIXES
+]
+DATASET_FILES = ["data.json"] + [
+    fpath
+    for data_type in DATA_TYPES
+    for fpath in (
+        f"csv_{data_type}.json",
+        f"csv_{data_type}_region.json",
+        f"csv_{data_type}_us_region.json"
+    )
+] + DERIVED_FILES
+# Columnar twins of the history documents, mapped by the API instead of parsed
+DATASET_COLUMNAR = {
+    fpath: columnar_fpath(fpath)
+    for data_type in DATA_TYPES
+    for fpath in (f"csv_{data_type}.json", f"csv_{data_type}_region.json", f"csv_{data_type}_us_region.json")
+}
+DATASET_BODIES = [
+    body_fpath(name, encoding)
+    for name, _, _ in collection_bodies(DATA_TYPES)
+    for encoding in (None,) + ENCODINGS
+]
 
 WORLD_POPULATION = 7800000000
 
+populations = {}
+groups = {}
+
 SPECIAL_CASES = {
     "US": {
         "name": "United States",
@@ -72,157 +135,240 @@ SPECIAL_CASES = {
 
 
 def update():
-    fs = [
-        lambda : dl_csv(CSV_CONFIRMED, CSV_CONFIRMED_FPATH),
-        lambda : dl_csv(CSV_DEATHS, CSV_DEATHS_FPATH),
-        lambda : dl_csv(CSV_RECOVERED, CSV_RECOVERD_FPATH),
-        lambda : dl_csv(CSV_CONFIRMED_US, CSV_CONFIRMED_FPATH_US),
-        lambda : dl_csv(CSV_DEATHS_US, CSV_DEATHS_FPATH_US),
-        lambda : dl_csv(CSV_RECOVERED_US, CSV_RECOVERED_FPATH_US),
-        lambda : csv_to_json(CSV_CONFIRMED_FPATH),
-        lambda : csv_to_json(CSV_DEATHS_FPATH),
-        lambda : csv_to_json(CSV_RECOVERD_FPATH),
-        lambda : region_csv_to_json(CSV_CONFIRMED_FPATH),
-        lambda : region_csv_to_json(CSV_DEATHS_FPATH),
-        lambda : region_csv_to_json(CSV_RECOVERD_FPATH),
-        lambda : region_csv_to_json(CSV_CONFIRMED_FPATH_US, is_us=True),
-        lambda : region_csv_to_json(CSV_DEATHS_FPATH_US),
-        lambda : region_csv_to_json(CSV_RECOVERED_FPATH_US),
-        lambda : store_data()
-    ]
-    threads: list[threading.Thread] = []
-    for x in fs:
-        t = threading.Thread(target=x)
-        threads.append(t)
-        t.start()
-        logging.info(f"Start {t.getName()}")
-    for x in threads:
-        logging.info(f"Waiting {x.getName()} to finish")
-        x.join()
+    out_dir = new_snapshot()
+    fetcher = Fetcher(FETCH_STATE_FPATH, pool_size=INGEST_WORKERS)
+    parser = SharedParser()
+    populations = PopulationIndex(CSV_UID_LOOKUP_FPATH)
+    iso = IsoIndex(ISO_FPATH, SPECIAL_CASES)
+    pipeline = Pipeline(max_workers=INGEST_WORKERS, reuse=lambda outputs: reuse_outputs(outputs, out_dir))
+    downloads = {
+        CSV_CONFIRMED_FPATH: CSV_CONFIRMED,
+        CSV_DEATHS_FPATH: CSV_DEATHS,
+        CSV_RECOVERD_FPATH: CSV_RECOVERED,
+        CSV_CONFIRMED_FPATH_US: CSV_CONFIRMED_US,
+        CSV_DEATHS_FPATH_US: CSV_DEATHS_US,
+        CSV_RECOVERED_FPATH_US: CSV_RECOVERED_US
+    }
+    # A download is changed relative to the last published fetch state, so the
+    # files a failed refresh left behind are parsed again by the next one
+    for fpath, url in downloads.items():
+        pipeline.add(f"dl:{fpath}", lambda url=url, fpath=fpath: dl_csv(url, fpath, fetcher), DOWNLOAD)
+    pipeline.add("dl:apify", lambda: dl_apify(fetcher), DOWNLOAD)
+    pipeline.add("dl:lookup", lambda: dl_csv(CSV_UID_LOOKUP, CSV_UID_LOOKUP_FPATH, fetcher), DOWNLOAD)
+
+    published = []
+    # Task writing each document a body is serialized from
+    producers = {"data.json": "data"}
+    for fpath in (CSV_CONFIRMED_FPATH, CSV_DEATHS_FPATH, CSV_RECOVERD_FPATH):
+        json_fname = output_fpath("", fpath, ".json")
+        region_fname = output_fpath("", fpath, "_region.json")
+        producers[json_fname] = f"json:{fpath}"
+        producers.update((derived_fpath(json_fname, suffix), f"derive:{fpath}") for suffix in DERIVED_SUFFIXES)
+        pipeline.add(f"json:{fpath}", lambda fpath=fpath: csv_to_json(fpath, out_dir, parser, iso), PARSE,
+                     deps=[f"dl:{fpath}"], outputs=[json_fname, columnar_fpath(json_fname)])
+        pipeline.add(f"region:{fpath}",
+                     lambda fpath=fpath: region_csv_to_json(fpath, False, out_dir, parser, populations, iso), PARSE,
+                     deps=[f"dl:{fpath}", "dl:lookup"], outputs=[region_fname, columnar_fpath(region_fname)])
+        pipeline.add(f"derive:{fpath}", lambda fpath=fpath: derive_data(fpath, out_dir), DERIVE,
+                     deps=[f"json:{fpath}"],
+                     outputs=[derived_fpath(json_fname, suffix) for suffix in DERIVED_SUFFIXES])
+        published += [f"json:{fpath}", f"region:{fpath}", f"derive:{fpath}"]
+    for fpath, is_us in ((CSV_CONFIRMED_FPATH_US, True), (CSV_DEATHS_FPATH_US, True), (CSV_RECOVERED_FPATH_US, False)):
+        region_fname = output_fpath("", fpath, "_region.json")
+        pipeline.add(f"region:{fpath}",
+                     lambda fpath=fpath, is_us=is_us: region_csv_to_json(fpath, is_us, out_dir, parser, populations, iso),
+                     PARSE, deps=[f"dl:{fpath}", "dl:lookup"], outputs=[region_fname, columnar_fpath(region_fname)])
+        published.append(f"region:{fpath}")
+    # store_data() fills its gaps from the history documents
+    pipeline.add("data", lambda: store_data(out_dir, iso), DERIVE,
+                 deps=["dl:apify", f"json:{CSV_CONFIRMED_FPATH}", f"json:{CSV_DEATHS_FPATH}",
+                       f"json:{CSV_RECOVERD_FPATH}"],
+                 outputs=["data.json"])
+    published.append("data")
+    # One task per body, compressing them runs in parallel and an unchanged
+    # source document carries its bodies over
+    for name, fpath, key in collection_bodies(DATA_TYPES):
+        pipeline.add(f"body:{name}", lambda name=name, fpath=fpath, key=key: write_body(name, fpath, key, out_dir),
+                     PUBLISH, deps=[producers[fpath]],
+                     outputs=[body_fpath(name, encoding) for encoding in (None,) + ENCODINGS])
+    pipeline.add("database", lambda: write_database(out_dir, iso), PUBLISH,
+                 deps=[name for name in published if name.startswith(("json:", "region:"))],
+                 outputs=[DATABASE_FPATH])
+
+    results = pipeline.run()
+    failed = [result.name for result in results.values() if result.error is not None]
+    if failed:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise IngestError(f"Ingest failed, keeping the current snapshot : {', '.join(failed)}")
+    write_iso_report(iso, out_dir)
+    # Published even when nothing changed: everything was carried over, the
+    # generation stays the same and only the time of the last update moves.
+    publish_generation(out_dir)
+    publish_snapshot(out_dir)
+    fetcher.save_state()
+
+
+def reuse_outputs(outputs, out_dir) -> bool:
+    """Hard links the outputs of a skipped task from the current snapshot into `out_dir`"""
+    if not all(os.path.exists(os.path.join(CURRENT_DIR, output)) for output in outputs):
+        return False
+    for output in outputs:
+        target = os.path.join(out_dir, output)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(os.path.join(CURRENT_DIR, output), target)
+        except OSError:
+            shutil.copy2(os.path.join(CURRENT_DIR, output), target)
+    return True
+
+
+def write_iso_report(iso, out_dir):
+    """Writes the names left without ISO codes, carrying over the documents of the skipped tasks"""
+    try:
+        report = read_json(os.path.join(CURRENT_DIR, ISO_REPORT_FPATH))
+    except (FileNotFoundError, ValueError):
+        report = {}
+    report.update(iso.report())
+    for document, names in report.items():
+        if names:
+            logging.warning(f"{document}: {len(names)} names without ISO codes : {', '.join(names)}")
+    atomic_write(os.path.join(out_dir, ISO_REPORT_FPATH), json.dumps(report))
 
 
+def publish_generation(out_dir):
+    """Writes the manifest the API watches to reload its in-memory datasets"""
+    manifest = publish_manifest(out_dir, DATASET_FILES + list(DATASET_COLUMNAR.values()) + DATASET_BODIES, CURRENT_DIR)
+    logging.info(f"Generation {manifest['generation']} staged in {out_dir}")
+    return manifest
 
-def dl_csv(csv_type, fpath):
-    r = requests.get(csv_type)
-    with open(fpath, "w+") as f:
-        f.write(r.text)
 
+def dl_csv(csv_type, fpath, fetcher=None):
+    """Downloads `csv_type` into `fpath`, returns whether the content changed"""
+    return (fetcher or Fetcher()).download(csv_type, fpath)
 
-def csv_to_json(csv_fpath):
-    csv_json = {}
-    with open("iso-3166.json", "r") as isof:
-        iso_data = json.load(isof)
-    with open(csv_fpath, "r") as csv_file:
-        data = csv.DictReader(csv_file)
-        for row in data:
-            if row["Country/Region"] not in csv_json:
-                if row["Country/Region"] in SPECIAL_CASES:
-                    country = SPECIAL_CASES[row["Country/Region"]]["name"]
-                else:
-                    country = row["Country/Region"]
-                csv_json[country] = {"history": {}}
-                for key in list(row.keys())[4:]:
-                    new_k = datetime.datetime.strptime(
-                        key, "%m/%d/%y").strftime("%m/%d/%y")
-                    csv_json[country]["history"][new_k] = int(row[key])
-            else:
-                for key in list(row.keys())[4:]:
-                    new_k = datetime.datetime.strptime(
-                        key, "%m/%d/%y").strftime("%m/%d/%y")
-                    csv_json[country]["history"][new_k] += int(row[key])
-            csv_json[country]["history"] = dict(sorted(csv_json[country]["history"].items(),
-                                                       key=lambda item: datetime.datetime.strptime(item[0],
-                                                                                                   "%m/%d/%y")))
-
-        for k in csv_json.keys():
-            for iso in iso_data:
-                if k.lower() == iso["name"].lower():
-                    csv_json[k]["iso2"] = iso["iso2"]
-                    csv_json[k]["iso3"] = iso["iso3"]
-            if k in SPECIAL_CASES:
-                csv_json[SPECIAL_CASES[k]["name"]
-                ]["iso2"] = SPECIAL_CASES[k]["iso2"]
-                csv_json[SPECIAL_CASES[k]["name"]
-                ]["iso3"] = SPECIAL_CASES[k]["iso3"]
-                continue
-            if not csv_json[k].get("iso2"):
-                csv_json[k]["iso2"] = ""
-                csv_json[k]["iso3"] = ""
-
-        with open(csv_fpath.replace(".csv", ".json"), "w+") as f:
-            f.write(str(json.dumps(csv_json)))
-
-
-def region_csv_to_json(csv_fpath, is_us=False):
+
+def dl_apify(fetcher=None):
+    return dl_csv(APIFY_URL, APIFY_FPATH, fetcher)
+
+
+def output_fpath(out_dir, csv_fpath, suffix):
+    return os.path.join(out_dir, os.path.basename(csv_fpath).replace(".csv", suffix))
+
+
+def parse_csv(csv_fpath, parser=None):
+    """Parsed rows of a JHU time series CSV with the columns in chronological order"""
+    parsed, values = (parser or SharedParser()).parse(csv_fpath)
+    order = sorted(range(len(parsed.dates)), key=lambda j: date_sort_key(parsed.dates[j]))
+    return parsed, [parsed.dates[j] for j in order], values[:, order]
+
+
+def canonical_country(country):
+    if country in SPECIAL_CASES:
+        return SPECIAL_CASES[country]["name"]
+    return country
+
+
+def group_rows(keys):
+    """Index of the group of every row, groups numbered by first appearance"""
+    groups = {}
+    rows = np.array([groups.setdefault(key, len(groups)) for key in keys], dtype=np.intp)
+    return list(groups), rows
+
+
+def csv_to_json(csv_fpath, out_dir=".", parser=None, iso=None):
+    """Writes the country histories of `csv_fpath`"""
+    iso = iso or IsoIndex(ISO_FPATH, SPECIAL_CASES)
+    json_fpath = output_fpath(out_dir, csv_fpath, ".json")
+    parsed, dates, values = parse_csv(csv_fpath, parser)
+    tree = GeoTree(zip(map(canonical_country, parsed.column("Country/Region")), parsed.column("Province/State")))
+    countries, totals = Rollup(tree, values).level(1)
     csv_json = {}
+    for i, (country,) in enumerate(countries):
+        iso2, iso3 = iso.codes(country, os.path.basename(json_fpath))
+        csv_json[country] = {"history": dict(zip(dates, totals[i].tolist())), "iso2": iso2, "iso3": iso3}
+
+    atomic_write(json_fpath, json.dumps(csv_json))
+    write_columnar(columnar_fpath(json_fpath), TimeSeries.from_history(csv_json))
+
+
+def region_csv_to_json(csv_fpath, is_us=False, out_dir=".", parser=None, populations=None, iso=None):
+    """Writes the province histories of `csv_fpath`.
+
+    US counties are rolled up into their state, elsewhere a province listed
+    twice keeps its last row. Their populations, from `populations`, are
+    aggregated the same way.
+    """
     if is_us:
         province_key = "Province_State"
         country_key = "Country_Region"
-        key_start = 12
     else:
         province_key = "Province/State"
         country_key = "Country/Region"
-        key_start = 4
-    with open("iso-3166.json", "r") as isof:
-        iso_data = json.load(isof)
-    with open(csv_fpath, "r") as csv_file:
-        data = csv.DictReader(csv_file)
-        for row in data:
-            if not len(row[province_key]):
-                continue
-            if row[country_key] in SPECIAL_CASES:
-                country = SPECIAL_CASES[row[country_key]]["name"]
-            else:
-                country = row[country_key]
-            if country not in csv_json:
-
-                csv_json[country] = {"regions": {}}
-                province = row[province_key]
-                for key in list(row.keys())[key_start:]:
-                    new_k = datetime.datetime.strptime(
-                        key, "%m/%d/%y").strftime("%m/%d/%y")
-                    if province not in csv_json[country]["regions"]:
-                        csv_json[country]["regions"][province] = {
-                            "history": {}
-                        }
-                    csv_json[country]["regions"][province]["history"][new_k] = int(
-                        float(row[key]))
-            else:
-                province = row[province_key]
-                for key in list(row.keys())[key_start:]:
-                    new_k = datetime.datetime.strptime(
-                        key, "%m/%d/%y").strftime("%m/%d/%y")
-                    if province not in csv_json[country]["regions"]:
-                        csv_json[country]["regions"][province] = {
-                            "history": {}
-                        }
-                    if is_us and csv_json[country]["regions"][province]["history"].get(new_k):
-                        csv_json[country]["regions"][province]["history"][new_k] += int(
-                            float(row[key]))
-                    else:
-                        csv_json[country]["regions"][province]["history"][new_k] = int(
-                            float(row[key]))
-            csv_json[country]["regions"][province]["history"] = {k: v for k, v in sorted(
-                csv_json[country]["regions"][province]["history"].items(),
-                key=lambda item: datetime.datetime.strptime(item[0], "%m/%d/%y"))}
-
-        for k in csv_json.keys():
-            for iso in iso_data:
-                if k.lower() == iso["name"].lower():
-                    csv_json[k]["iso2"] = iso["iso2"]
-                    csv_json[k]["iso3"] = iso["iso3"]
-            if k in SPECIAL_CASES:
-                csv_json[SPECIAL_CASES[k]["name"]
-                ]["iso2"] = SPECIAL_CASES[k]["iso2"]
-                csv_json[SPECIAL_CASES[k]["name"]
-                ]["iso3"] = SPECIAL_CASES[k]["iso3"]
-                continue
-            if not csv_json[k].get("iso2"):
-                csv_json[k]["iso2"] = ""
-                csv_json[k]["iso3"] = ""
-
-        with open(csv_fpath.replace(".csv", "_region.json"), "w+") as f:
-            f.write(str(json.dumps(csv_json)))
+    iso = iso or IsoIndex(ISO_FPATH, SPECIAL_CASES)
+    json_fpath = output_fpath(out_dir, csv_fpath, "_region.json")
+    parsed, dates, values = parse_csv(csv_fpath, parser)
+    keys = [
+        (canonical_country(country), province)
+        for country, province in zip(parsed.column(country_key), parsed.column(province_key))
+    ]
+    kept = [i for i, (_, province) in enumerate(keys) if province]
+    populations = populations or PopulationIndex(CSV_UID_LOOKUP_FPATH)
+    if is_us:
+        counties = parsed.column("Admin2")
+        tree = GeoTree([(*keys[i], counties[i]) for i in kept])
+        regions, totals = Rollup(tree, values[kept]).level(2)
+        uids = parsed.column("UID")
+        population = rollup_population(tree, populations.by_uids([uids[i] for i in kept])).levels[2]
+    else:
+        regions, rows = group_rows([keys[i] for i in kept])
+        last = np.zeros(len(regions), dtype=np.intp)
+        last[rows] = np.arange(len(kept))
+        totals = values[kept][last]
+        raw_keys = list(zip(parsed.column(country_key), parsed.column(province_key)))
+        population = populations.by_regions([raw_keys[kept[j]] for j in last])
+    csv_json = {}
+    for i, (country, province) in enumerate(regions):
+        entry = {"history": dict(zip(dates, totals[i].tolist()))}
+        if not np.isnan(population[i]):
+            entry["population"] = int(population[i])
+        csv_json.setdefault(country, {"regions": {}})["regions"][province] = entry
+    for country, entry in csv_json.items():
+        entry["iso2"], entry["iso3"] = iso.codes(country, os.path.basename(json_fpath))
+
+    atomic_write(json_fpath, json.dumps(csv_json))
+    write_columnar(columnar_fpath(json_fpath), TimeSeries.from_regions(csv_json))
+
+
+def derive_data(csv_fpath, out_dir="."):
+    """Writes the daily, per-capita and world total documents next to `csv_to_json` output"""
+    json_fpath = output_fpath(out_dir, csv_fpath, ".json")
+    data = read_json(json_fpath)
+    for suffix, derived in derive(data, get_populations(), WORLD_POPULATION).items():
+        atomic_write(derived_fpath(json_fpath, suffix), json.dumps(derived))
+
+
+def write_body(name, fpath, key=None, out_dir="."):
+    """Pre-serializes the collection endpoint `name` from its source document, raw and compressed"""
+    os.makedirs(os.path.join(out_dir, BODIES_DIR), exist_ok=True)
+    data = read_json(os.path.join(out_dir, fpath))
+    body = serialize(data if key is None else {key: data[key]})
+    atomic_write(os.path.join(out_dir, body_fpath(name)), body, binary=True)
+    for encoding, encoded in compress(body).items():
+        atomic_write(os.path.join(out_dir, body_fpath(name, encoding)), encoded, binary=True)
+
+
+def write_database(out_dir=".", iso=None):
+    """Loads the columnar history documents into the SQLite database of the `sqlite` query engine"""
+    iso = iso or IsoIndex(ISO_FPATH, SPECIAL_CASES)
+    documents = []
+    for fpath, bin_fpath in DATASET_COLUMNAR.items():
+        data_type = next(data_type for data_type in DATA_TYPES if fpath.startswith(f"csv_{data_type}"))
+        documents.append((fpath, data_type, load_columnar(os.path.join(out_dir, bin_fpath))))
+    resolvers = {
+        fpath: Resolver.from_series(series, iso.table(), SPECIAL_CASES)
+        for fpath, _, series in documents
+    }
+    build_database(os.path.join(out_dir, DATABASE_FPATH), documents, resolvers)
 
 
 def csv_to_dict(csv_fpath):
@@ -235,6 +381,22 @@ def csv_to_dict(csv_fpath):
         return dict_out
 
 
+def get_populations():
+    """Population by ISO3, reloaded from `CSV_POPULATIONS` until it is available"""
+    global populations
+    if not populations:
+        populations = csv_to_dict(CSV_POPULATIONS)
+    return populations
+
+
+def get_groups():
+    """Members of each custom group by ISO3, read once from `GROUPS_FPATH`"""
+    global groups
+    if not groups:
+        groups = read_json(GROUPS_FPATH)
+    return groups
+
+
 def find_val_replace_null(country, data, base):
     try:
         return list(data[country]["history"].values())[-1]
@@ -244,11 +406,11 @@ def find_val_replace_null(country, data, base):
     return base
 
 
-def replace_null_value(dataset: list):
+def replace_null_value(dataset: list, out_dir="."):
     new_dataset = []
-    data_c = read_json(CSV_CONFIRMED_FPATH.replace(".csv", ".json"))
-    data_r = read_json(CSV_RECOVERD_FPATH.replace(".csv", ".json"))
-    data_d = read_json(CSV_DEATHS_FPATH.replace(".csv", ".json"))
+    data_c = read_json(output_fpath(out_dir, CSV_CONFIRMED_FPATH, ".json"))
+    data_r = read_json(output_fpath(out_dir, CSV_RECOVERD_FPATH, ".json"))
+    data_d = read_json(output_fpath(out_dir, CSV_DEATHS_FPATH, ".json"))
     for kv_replace in dataset:
         tmp = kv_replace
         confirmed = find_val_replace_null(
@@ -271,38 +433,25 @@ def replace_null_value(dataset: list):
     return new_dataset
 
 
-def store_data():
+def store_data(out_dir=".", iso=None):
     timestamp_update = int(time.time())
-    r = requests.get(APIFY_URL)
-    apify_data = r.json()
-    with open("iso-3166.json", "r") as isof:
-        iso_data = json.load(isof)
+    apify_data = read_json(APIFY_FPATH)
+    iso = iso or IsoIndex(ISO_FPATH, SPECIAL_CASES)
     merged_data = []
     for apify in apify_data["regionData"]:
         if apify["country"] == "Total:":
             continue
-        iso_found = False
         apify_normalized = unicodedata.normalize(
             'NFKD', apify["country"]).encode('ascii', 'ignore').decode("utf-8")
         if apify_normalized in SPECIAL_CASES:
             apify_normalized = SPECIAL_CASES[apify_normalized]["name"]
             apify["country"] = apify_normalized
-        for iso in iso_data:
-            if apify_normalized.lower() == iso["name"].lower():
-                apify["iso2"] = iso["iso2"]
-                apify["iso3"] = iso["iso3"]
-                iso_found = True
-                break
-        if not iso_found:
-            apify["iso2"] = ""
-            apify["iso3"] = ""
+        apify["iso2"], apify["iso3"] = iso.codes(apify_normalized, "data.json")
         apify["lastUpdate"] = timestamp_update
         merged_data.append(apify)
 
-    merged_data = replace_null_value(merged_data)
-    with open("data.json", "w+") as fd:
-        dumps = json.dumps(merged_data)
-        fd.write(str(dumps))
+    merged_data = replace_null_value(merged_data, out_dir)
+    atomic_write(os.path.join(out_dir, "data.json"), json.dumps(merged_data))
 
 
 def read_json(fpath: str):
@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import sentry_sdk
+
+# src.utils reads the owner key at import
+os.environ.setdefault("Authorization", "test")
+
+import src.utils as util  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sent by the test clients, the owner key is exempt from rate limits
+AUTH = {"Authorization": os.environ["Authorization"]}
+GLOBAL_ROWS = [("", "France"), ("", "Germany"), ("Ontario", "Canada"), ("Quebec", "Canada")]
+US_ROWS = [(84001001, "Autauga", "Alabama"), (84001003, "Baldwin", "Alabama"), (84006001, "Alameda", "California")]
+UPSTREAM_FILES = (("CSV_CONFIRMED", "time_series_covid19_confirmed_global.csv"),
+                  ("CSV_DEATHS", "time_series_covid19_deaths_global.csv"),
+                  ("CSV_RECOVERED", "time_series_covid19_recovered_global.csv"),
+                  ("CSV_RECOVERED_US", "time_series_covid19_recovered_global.csv"),
+                  ("CSV_CONFIRMED_US", "time_series_covid19_confirmed_US.csv"),
+                  ("CSV_DEATHS_US", "time_series_covid19_deaths_US.csv"),
+                  ("CSV_UID_LOOKUP", "UID_ISO_FIPS_LookUp_Table.csv"),
+                  ("APIFY_URL", "apify.json"))
+
+
+def dates(days):
+    first = datetime.date(2020, 1, 22)
+    return [(first + datetime.timedelta(days=d)).strftime("%-m/%-d/%y") for d in range(days)]
+
+
+def write_upstream(root, days):
+    header = ",".join(dates(days))
+    for data_type in ("confirmed", "deaths", "recovered"):
+        lines = [f"Province/State,Country/Region,Lat,Long,{header}"]
+        lines += [f"{province},{country},0,0,{','.join(str(i + d) for d in range(days))}"
+                  for i, (province, country) in enumerate(GLOBAL_ROWS)]
+        (root / f"time_series_covid19_{data_type}_global.csv").write_text("\n".join(lines) + "\n")
+    for data_type in ("confirmed", "deaths"):
+        lines = [f"UID,iso2,iso3,code3,FIPS,Admin2,Province_State,Country_Region,Lat,Long_,Combined_Key,{header}"]
+        lines += [f'{uid},US,USA,840,1,{county},{state},US,0,0,"{county}, {state}, US",'
+                  f"{','.join(str(d) for d in range(days))}" for uid, county, state in US_ROWS]
+        (root / f"time_series_covid19_{data_type}_US.csv").write_text("\n".join(lines) + "\n")
+    lines = ["UID,iso2,iso3,code3,FIPS,Admin2,Province_State,Country_Region,Lat,Long_,Combined_Key,Population"]
+    lines += [f"{uid},US,USA,840,1,{county},{state},US,0,0,x,1000" for uid, county, state in US_ROWS]
+    (root / "UID_ISO_FIPS_LookUp_Table.csv").write_text("\n".join(lines) + "\n")
+    apify = {"regionData": [{"country": "France", "totalCases": None, "newCases": None, "totalDeaths": None,
+                             "totalRecovered": None, "activeCases": None}]}
+    (root / "apify.json").write_text(json.dumps(apify))
+
+
+def make_workdir(work):
+    """Directory `update` can run in, with the static inputs of the repo"""
+    (work / "data").mkdir(parents=True)
+    shutil.copy(os.path.join(REPO, util.ISO_FPATH), work)
+    shutil.copy(os.path.join(REPO, util.CSV_POPULATIONS), work / "data")
+    shutil.copy(os.path.join(REPO, util.GROUPS_FPATH), work / "data")
+    return work
+
+
+@pytest.fixture
+def workdir(upstream, tmp_path, monkeypatch):
+    """Working directory of an ingest from `upstream`, the current directory of the test"""
+    work = make_workdir(tmp_path / "work")
+    monkeypatch.chdir(work)
+    for name, fname in UPSTREAM_FILES:
+        monkeypatch.setattr(util, name, f"{upstream.url}/{fname}")
+    return work
+
+
+@pytest.fixture
+def published(upstream, workdir):
+    """`workdir` once 30 days from `upstream` are published in it"""
+    write_upstream(workdir.parent / "upstream", 30)
+    util.update()
+    return workdir
+
+
+@pytest.fixture
+def load_app(tmp_path, monkeypatch):
+    """Imports a fresh `app` module serving the current directory, configured by the given environment"""
+    monkeypatch.setattr(sentry_sdk, "init", lambda *args, **kwargs: None)
+
+    def load(**env):
+        env = {"BASE_PATH": "", "CACHE_DIR": str(tmp_path / "cache"), **env}
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        sys.modules.pop("app", None)
+        return importlib.import_module("app")
+
+    yield load
+    sys.modules.pop("app", None)
+
+
+@pytest.fixture
+def client(published, load_app):
+    """Test client of an app serving the `published` data"""
+    return load_app().app.test_client()
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Serves the files of the server `root` with a content ETag, like the upstream raw file hosts"""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        try:
+            with open(os.path.join(self.server.root, self.path.lstrip("/")), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """Local stand-in for the upstream hosts, serving the files written to `upstream.root`"""
+    root = tmp_path / "upstream"
+    root.mkdir()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    server.root = str(root)
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
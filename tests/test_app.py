@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+import src.utils as util
+from src.manifest import read_manifest
+from src.snapshots import CURRENT_DIR
+from tests.conftest import AUTH, make_workdir, write_upstream
+
+
+def test_cache_and_etags_are_keyed_by_content_not_generation(upstream, workdir, load_app, tmp_path, monkeypatch):
+    root = workdir.parent / "upstream"
+    write_upstream(root, 30)
+    util.update()
+    client = load_app().app.test_client()
+    history = client.get("/api/v1/history/confirmed/France", headers=AUTH)
+    body = client.get("/api/v1/history/confirmed", headers=AUTH)
+    assert len(json.loads(history.data)["history"]) == 30
+
+    # A new data dir published as generation 1 again, served with the same cache dir
+    monkeypatch.chdir(make_workdir(tmp_path / "other"))
+    write_upstream(root, 31)
+    util.update()
+    assert read_manifest(CURRENT_DIR)["generation"] == read_manifest(os.path.join(workdir, CURRENT_DIR))["generation"]
+    client = load_app().app.test_client()
+    assert len(json.loads(client.get("/api/v1/history/confirmed/France", headers=AUTH).data)["history"]) == 31
+    swapped = client.get("/api/v1/history/confirmed", headers={**AUTH, "If-None-Match": body.headers["ETag"]})
+    assert swapped.status_code == 200
+    assert swapped.headers["ETag"] != body.headers["ETag"]
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/history/confirmed",
+    "/api/v1/history/confirmed?last=3",
+    "/api/v1/history/confirmed?format=csv",
+    "/api/v1/history/confirmed/France",
+    "/api/v1/proportion/confirmed/France?format=msgpack",
+    "/api/v1/all/",
+])
+def test_negotiated_responses_vary_on_accept(client, path):
+    response = client.get(path, headers=AUTH)
+    assert response.status_code == 200
+    assert "Accept" in response.vary and "Accept-Encoding" in response.vary
+
+
+def test_not_modified_body_varies_on_accept(client):
+    etag = client.get("/api/v1/history/confirmed", headers=AUTH).headers["ETag"]
+    response = client.get("/api/v1/history/confirmed", headers={**AUTH, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert "Accept" in response.vary and "Accept-Encoding" in response.vary
@@ -0,0 +1,47 @@
+import pytest
+
+from tests.conftest import AUTH
+
+ROUTES = [
+    "/api/v1/history/{data_type}/France",
+    "/api/v1/history/{data_type}/fr",
+    "/api/v1/history/{data_type}/Canada",
+    "/api/v1/history/{data_type}/nowhere",
+    "/api/v1/history/{data_type}/Canada/regions",
+    "/api/v1/history/{data_type}/us/regions",
+    "/api/v1/history/{data_type}/nowhere/regions",
+    "/api/v1/history/{data_type}/Canada/ontario",
+    "/api/v1/history/{data_type}/us/alabama",
+    "/api/v1/history/{data_type}/Canada/nowhere",
+    "/api/v1/proportion/{data_type}/us/regions",
+    "/api/v1/proportion/{data_type}/us/Alabama",
+    "/api/v1/proportion/{data_type}/Canada/Quebec",
+    "/api/v1/proportion-daily/{data_type}/us/regions",
+    "/api/v1/proportion-daily/{data_type}/us/California",
+    "/api/v1/analytics/{data_type}/us/Alabama",
+    "/api/v1/analytics/{data_type}/Canada/Ontario?days=3",
+]
+WINDOWS = ["", "from=2020-01-25&to=2020-02-05", "last=5", "from=02/30/20"]
+FORMATS = ["", "format=csv", "format=msgpack"]
+
+
+def responses(load_app, engine, cache_dir, paths):
+    client = load_app(QUERY_ENGINE=engine, CACHE_DIR=str(cache_dir)).app.test_client()
+    ret = {}
+    for path in paths:
+        response = client.get(path, headers=AUTH)
+        ret[path] = response.status_code, response.headers.get("Content-Type"), response.data
+    return ret
+
+
+@pytest.mark.parametrize("data_type", ["confirmed", "deaths"])
+def test_sqlite_engine_answers_like_the_memory_one(published, load_app, tmp_path, data_type):
+    paths = []
+    for route in ROUTES:
+        for query in WINDOWS + FORMATS:
+            separator = "&" if "?" in route else "?"
+            paths.append(route.format(data_type=data_type) + (separator + query if query else ""))
+    memory = responses(load_app, "memory", tmp_path / "memory-cache", paths)
+    sqlite = responses(load_app, "sqlite", tmp_path / "sqlite-cache", paths)
+    assert {path for path in paths if memory[path][0] == 200}, "nothing was found"
+    assert [path for path in paths if memory[path] != sqlite[path]] == []
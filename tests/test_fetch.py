@@ -0,0 +1,59 @@
+from src.fetch import Fetcher
+
+
+def test_download_writes_the_document(upstream, tmp_path):
+    (tmp_path / "upstream" / "a.csv").write_bytes(b"a,b\n1,2\n")
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    assert fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv")) is True
+    assert (tmp_path / "a.csv").read_bytes() == b"a,b\n1,2\n"
+    assert upstream.requests == [("/a.csv", None)]
+
+
+def test_not_modified_after_publish(upstream, tmp_path):
+    (tmp_path / "upstream" / "a.csv").write_bytes(b"a,b\n1,2\n")
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv"))
+    fetcher.save_state()
+
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    assert fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv")) is False
+    path, etag = upstream.requests[-1]
+    assert etag is not None
+    assert len(upstream.requests) == 2
+
+
+def test_one_request_per_url(upstream, tmp_path):
+    (tmp_path / "upstream" / "a.csv").write_bytes(b"a,b\n1,2\n")
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    assert fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv")) is True
+    assert fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "b.csv")) is True
+    assert (tmp_path / "b.csv").read_bytes() == b"a,b\n1,2\n"
+    assert len(upstream.requests) == 1
+
+
+def test_changed_relative_to_the_published_fetch(upstream, tmp_path):
+    document = tmp_path / "upstream" / "a.csv"
+    document.write_bytes(b"a,b\n1,2\n")
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv"))
+    fetcher.save_state()
+
+    # A refresh downloads the new document then fails: its state is not saved
+    document.write_bytes(b"a,b\n1,2\n3,4\n")
+    assert Fetcher(str(tmp_path / "state.json")).download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv")) is True
+
+    # The working file already holds it, it still has to be published
+    assert Fetcher(str(tmp_path / "state.json")).download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv")) is True
+
+
+def test_not_modified_restores_an_overwritten_file(upstream, tmp_path):
+    (tmp_path / "upstream" / "a.csv").write_bytes(b"a,b\n1,2\n")
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv"))
+    fetcher.save_state()
+    (tmp_path / "a.csv").write_bytes(b"left over by a failed refresh")
+
+    fetcher = Fetcher(str(tmp_path / "state.json"))
+    assert fetcher.download(f"{upstream.url}/a.csv", str(tmp_path / "a.csv")) is False
+    assert (tmp_path / "a.csv").read_bytes() == b"a,b\n1,2\n"
+    assert [etag is None for _, etag in upstream.requests] == [True, False, True]
@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+
+import msgpack
+import pytest
+
+from src.formats import MIMETYPES
+from tests.conftest import AUTH
+
+# Path, key of the series in its JSON entries, whether the JSON is one entry or a collection of them
+ENDPOINTS = [
+    ("/api/v1/history/confirmed", "history", False),
+    ("/api/v1/daily/deaths?last=5", "daily", False),
+    ("/api/v1/proportion/confirmed?from=2020-02-01", "proportion", False),
+    ("/api/v1/proportion-daily/recovered?limit=2", "proportion-daily", False),
+    ("/api/v1/history/confirmed/Canada/regions", "history", False),
+    ("/api/v1/history/deaths/France?last=7", "history", True),
+    ("/api/v1/proportion/confirmed/Germany", "proportion", True),
+    ("/api/v1/daily/confirmed/total", "daily", True),
+]
+
+
+def decode_csv(data):
+    header, *rows = csv.reader(io.StringIO(data.decode()))
+    dates = [column for column in header if column.count("/") == 2]
+    return {row[0]: dict(zip(dates, (float(cell) if cell else None for cell in row[-len(dates):]))) for row in rows}
+
+
+def decode_frame(frame):
+    return {name: dict(zip(frame["dates"], row)) for name, row in zip(frame["names"], frame["values"])}
+
+
+DECODERS = {
+    "csv": decode_csv,
+    "columnar": lambda data: decode_frame(json.loads(data)),
+    "msgpack": lambda data: decode_frame(msgpack.unpackb(data)),
+}
+
+
+def expected(data, key, single):
+    """Series of a JSON response by name, the proportions being rendered as strings"""
+    entries = {data.get("name", "World"): data} if single else data
+    return {
+        name: {date: float(value) for date, value in entry[key].items()}
+        for name, entry in entries.items()
+    }
+
+
+def cells(series):
+    """`(name, date) -> value`, flat for `pytest.approx`"""
+    return {(name, date): value for name, values in series.items() for date, value in values.items()}
+
+
+@pytest.mark.parametrize("path, key, single", ENDPOINTS)
+@pytest.mark.parametrize("fmt", ["csv", "columnar", "msgpack"])
+def test_compact_formats_round_trip_to_the_json_series(client, path, key, single, fmt):
+    separator = "&" if "?" in path else "?"
+    reference = client.get(path, headers=AUTH)
+    response = client.get(f"{path}{separator}format={fmt}", headers=AUTH)
+    assert response.status_code == 200
+    assert response.mimetype == MIMETYPES[fmt]
+    decoded = DECODERS[fmt](response.data)
+    assert cells(decoded) == pytest.approx(cells(expected(json.loads(reference.data), key, single)), abs=1e-5)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "msgpack"])
+def test_accept_header_negotiates_the_format(client, fmt):
+    response = client.get("/api/v1/history/confirmed", headers={**AUTH, "Accept": MIMETYPES[fmt]})
+    assert response.mimetype == MIMETYPES[fmt]
+
+
+@pytest.mark.parametrize("path", ["/api/v1/history/confirmed", "/api/v1/history/confirmed/France"])
+def test_unknown_format_is_a_bad_request(client, path):
+    response = client.get(f"{path}?format=xml", headers=AUTH)
+    assert response.status_code == 400
+    assert b"Unknown format 'xml'" in response.data
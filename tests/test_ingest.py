@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+import src.utils as util
+from src.ingest import IngestError
+from src.snapshots import CURRENT_DIR
+from tests.conftest import write_upstream
+
+def published_dates(fname, key="history"):
+    with open(os.path.join(CURRENT_DIR, fname), "r") as f:
+        return len(next(iter(json.load(f).values()))[key])
+
+
+def test_refresh_after_a_failed_one_publishes_the_new_data(upstream, workdir):
+    root = workdir.parent / "upstream"
+    write_upstream(root, 30)
+    util.update()
+    assert published_dates("csv_confirmed.json") == 30
+
+    # Upstream adds a day, the refresh downloads it then fails on Apify
+    write_upstream(root, 31)
+    os.unlink(root / "apify.json")
+    with pytest.raises(IngestError):
+        util.update()
+    assert published_dates("csv_confirmed.json") == 30
+
+    write_upstream(root, 31)
+    util.update()
+    assert published_dates("csv_confirmed.json") == 31
+    assert published_dates("csv_confirmed_daily.json", "daily") == 31
+    with open(os.path.join(CURRENT_DIR, "csv_confirmed_us_region.json"), "r") as f:
+        assert len(json.load(f)["United States"]["regions"]["Alabama"]["history"]) == 31
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.derive import UNSUPPORTED, proportion_daily_entry, proportion_entry
+from src.errors import InvalidParameter
+from src.series import TimeSeries, parse_date
+
+
+@pytest.mark.parametrize("date, key", [
+    ("02/29/20", (20, 2, 29)),
+    ("3/1/20", (20, 3, 1)),
+    ("2020-02-29", (20, 2, 29)),
+    ("2021-3-1", (21, 3, 1)),
+])
+def test_parse_date(date, key):
+    assert parse_date(date) == key
+
+
+@pytest.mark.parametrize("date", ["2020-02-30", "02/31/20", "02/29/21", "2020-13-01", "1920-03-01", "03/01/2020",
+                                  "20-03-01", "nope", "1/2"])
+def test_parse_date_rejects(date):
+    with pytest.raises(InvalidParameter):
+        parse_date(date)
+
+
+def test_window():
+    series = TimeSeries(["1/22/20", "1/23/20", "1/24/20"], ["France"], np.array([[1, 2, 3]]), ["FR"], ["FRA"])
+    assert series.window("2020-01-23") == slice(1, 3)
+    assert series.window(stop="01/23/20", last=1) == slice(1, 2)
+    assert series.window(last=0) == slice(3, 3)
+    with pytest.raises(InvalidParameter, match="non-negative"):
+        series.window(last=-1)
+    with pytest.raises(InvalidParameter):
+        series.window("2020-02-30")
+
+
+def test_per_capita_of_an_unknown_or_zero_population_is_nan():
+    series = TimeSeries(["1/22/20", "1/23/20"], ["A", "B", "C"], np.array([[1, 2], [3, 4], [5, 6]]),
+                        ["", "", ""], ["", "", ""])
+    with np.errstate(all="raise"):
+        ratio = series.per_capita(series.values, np.array([200.0, 0.0, np.nan]))
+        assert np.isnan(series.per_capita(series.values[1], 0)).all()
+    assert ratio[0].tolist() == [0.5, 1.0]
+    assert np.isnan(ratio[1:]).all()
+
+
+@pytest.mark.parametrize("population", [0, float("nan")])
+def test_proportions_of_an_unknown_or_zero_population_are_unsupported(population):
+    series = TimeSeries(["1/22/20", "1/23/20"], ["A"], np.array([[1, 2]]), [""], [""])
+    assert proportion_entry(series, 0, population) == {"proportion": UNSUPPORTED}
+    assert proportion_daily_entry(series, 0, population) == {"proportion-daily": UNSUPPORTED}